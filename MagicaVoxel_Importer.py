@@ -1,12 +1,34 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import multiprocessing
 import os
-
-import bpy
-import bmesh
-from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, IntProperty, FloatProperty, BoolProperty, CollectionProperty, EnumProperty
-from bpy.types import Operator
-
 import struct
+import tempfile
+import time
+import tracemalloc
+import types
+import zipfile
+
+import numpy as np
+
+try:
+    import pyopenvdb as openvdb
+except ImportError:
+    try:
+        import openvdb # Name of the bindings since OpenVDB 12.
+    except ImportError: # Volumes are meshed like other voxels.
+        openvdb = None
+
+try:
+    import bpy
+    from bpy_extras.io_utils import ImportHelper
+    from bpy.props import StringProperty, IntProperty, FloatProperty, BoolProperty, CollectionProperty, EnumProperty
+    from bpy.types import Operator
+    from mathutils import Matrix, Vector
+except ImportError: # Running outside of Blender, only the .vox document model is usable.
+    bpy = None
 
 bl_info = {
     "name": "MagicaVoxel VOX Importer",
@@ -19,490 +41,2436 @@ bl_info = {
     "category": "Import-Export"}
 
 
-class ImportVox(Operator, ImportHelper):
-    bl_idname = "import_scene.vox"
-    bl_label = "Import Vox"
-    bl_options = {'PRESET', 'UNDO'}
-
-    files: CollectionProperty(name="File Path",
-                              description="File path used for importing the VOX file",
-                              type=bpy.types.OperatorFileListElement)
-
-    directory: StringProperty()
-
-    filename_ext = ".vox"
-    filter_glob: StringProperty(
-        default="*.vox",
-        options={'HIDDEN'},
-    )
+if bpy is not None:
+    class ImportVox(Operator, ImportHelper):
+        bl_idname = "import_scene.vox"
+        bl_label = "Import Vox"
+        bl_options = {'PRESET', 'UNDO'}
+
+        files: CollectionProperty(name="File Path",
+                                  description="File path used for importing the VOX file",
+                                  type=bpy.types.OperatorFileListElement)
+
+        directory: StringProperty()
+
+        filename_ext = ".vox"
+        filter_glob: StringProperty(
+            default="*.vox",
+            options={'HIDDEN'},
+        )
+
+        voxel_size: FloatProperty(name = "Voxel Size",
+                                    description = "Side length, in blender units, of each voxel.",
+                                    default=1.0)
+
+        material_type: EnumProperty(name = "",
+                                    description = "How color and material data is imported",
+                                    items = (
+                                        ('None', 'None', "Don't import palette."),
+                                        ('SepMat', 'Separate Materials', "Create a material for each palette color."),
+                                        ('VertCol', 'Vertex Colors', "Create one material and store color and material data in vertex colors."),
+                                        ('Tex', 'Textures', "Generates textures to store color and material data.")
+                                    ),
+                                    default = 'SepMat')
+
+        gamma_correct: BoolProperty(name = "Gamma Correct Colors",
+                                    description = "Changes the gamma of colors to look closer to how they look in MagicaVoxel. Only applies if Palette Import Method is Seperate Materials.",
+                                    default = True)
+        gamma_value: FloatProperty(name = "Gamma Correction Value",
+                                    default=2.2, min=0)
+
+        override_materials: BoolProperty(name = "Override Existing Materials", default = True)
+
+        meshing: EnumProperty(name = "Meshing",
+                                    description = "How voxel faces are turned into polygons",
+                                    items = (
+                                        ('Culled', 'Culled Faces', "One quad for every exposed voxel face."),
+                                        ('Greedy', 'Greedy', "Merge neighboring faces with the same color into larger quads."),
+                                        ('Points', 'Points', "Only a vertex per voxel, turned into cubes by a Geometry Nodes modifier. Fastest for dense or scattered models.")
+                                    ),
+                                    default = 'Culled')
+
+        proxies: BoolProperty(name = "Bounding Box Proxies",
+                                description = "Only read the scene and add an empty showing the bounds of each model. Mesh them later with Object > Realize Voxel Proxies.",
+                                default = False)
 
-    voxel_size: FloatProperty(name = "Voxel Size",
-                                description = "Side length, in blender units, of each voxel.",
-                                default=1.0)
+        brick_size: IntProperty(name = "Streaming Brick Size",
+                                description = "Mesh large models in cubes of this many voxels to limit memory use. 0 meshes each model at once.",
+                                default = 0, min = 0, max = 256)
 
-    material_type: EnumProperty(name = "",
-                                description = "How color and material data is imported",
+        lods: EnumProperty(name = "LODs",
+                                description = "Also create lower detail copies of every model, downsampled by these factors. Each level goes into its own collection, hidden by default.",
                                 items = (
-                                    ('None', 'None', "Don't import palette."),
-                                    ('SepMat', 'Separate Materials', "Create a material for each palette color."),
-                                    ('VertCol', 'Vertex Colors', "Create one material and store color and material data in vertex colors."),
-                                    ('Tex', 'Textures', "Generates textures to store color and material data.")
+                                    ('2', '2x', "Half resolution."),
+                                    ('4', '4x', "Quarter resolution."),
+                                    ('8', '8x', "Eighth resolution.")
                                 ),
-                                default = 'SepMat')
-
-    gamma_correct: BoolProperty(name = "Gamma Correct Colors",
-                                description = "Changes the gamma of colors to look closer to how they look in MagicaVoxel. Only applies if Palette Import Method is Seperate Materials.",
-                                default = True)
-    gamma_value: FloatProperty(name = "Gamma Correction Value",
-                                default=2.2, min=0)
-
-    override_materials: BoolProperty(name = "Override Existing Materials", default = True)
-
-    cleanup_mesh: BoolProperty(name = "Cleanup Mesh",
-                                description = "Merge overlapping verticies and recalculate normals.",
-                                default = True)
+                                options = {'ENUM_FLAG'},
+                                default = set())
 
-    create_lights: BoolProperty(name = "Add Point Lights",
-                                description = "Add point lights at emissive voxels for Eevee.",
+        scene_culling: BoolProperty(name = "Cull Between Models",
+                                description = "Remove faces covered by voxels of neighboring models. Faces of models used more than once are only removed if they're covered everywhere the model is used.",
                                 default = False)
 
-    #todo
-    create_volume: BoolProperty(name = "Generate Volumes",
-                                description = "Create volume objects for volumetric voxels.",
-                                default = False)
-
-    organize: BoolProperty(name = "Organize Objects",
-                            description = "Organize objects into collections.",
-                            default = True)
-
+        cleanup_mesh: BoolProperty(name = "Cleanup Mesh",
+                                    description = "Merge overlapping verticies.",
+                                    default = True)
 
-    def execute(self, context):
-        paths = [os.path.join(self.directory, name.name) for name in self.files]
-        if not paths:
-            paths.append(self.filepath)
+        create_lights: BoolProperty(name = "Add Point Lights",
+                                    description = "Add point lights at emissive voxels for Eevee.",
+                                    default = False)
 
-        for path in paths:
-            import_vox(path, self)
+        light_cluster_size: IntProperty(name = "Light Cluster Size",
+                                description = "Emissive voxels of the same color inside cubes of this many voxels share one light. 1 adds a light for every emissive voxel.",
+                                default = 1, min = 1, max = 256)
 
-        return {"FINISHED"}
+        max_lights: IntProperty(name = "Max Lights",
+                                description = "Upper limit on the number of lights added per file. Clusters are made larger until the lights fit. 0 for no limit.",
+                                default = 0, min = 0)
 
-    def draw(self, context):
-        layout = self.layout
+        create_volume: BoolProperty(name = "Generate Volumes",
+                                    description = "Import glass and media voxels as OpenVDB volumes instead of meshing them. Needs the OpenVDB Python module.",
+                                    default = False)
 
-        layout.prop(self, "voxel_size")
-
-        material_type = layout.column(align=True)
-        material_type.label(text = "Palette Import Method:")
-        material_type.prop(self, "material_type")
-
-        if self.material_type == 'SepMat':
-            layout.prop(self, "gamma_correct")
-            if self.gamma_correct:
-                layout.prop(self, "gamma_value")
-        if self.material_type != 'None':
-            layout.prop(self, "override_materials")
-
-        layout.prop(self, "cleanup_mesh")
-        layout.prop(self, "create_lights")
-        #layout.prop(self, "create_volume")
-        layout.prop(self, "organize")
-
-################################################################################################################################################
-################################################################################################################################################
+        organize: BoolProperty(name = "Organize Objects",
+                                description = "Organize objects into collections.",
+                                default = True)
 
-class Vec3:
-    def __init__(self, X, Y, Z):
-        self.x, self.y, self.z = X, Y, Z
+        use_cache: BoolProperty(name = "Cache Meshes",
+                                description = "Store parsed and meshed files on disk and reuse them when the same file is imported again with the same meshing options.",
+                                default = False)
 
-    def _index(self):
-        return self.x + self.y*256 + self.z*256*256
+        cache_directory: StringProperty(name = "Cache Directory",
+                                description = "Where cached meshes are stored. Uses the system's temporary directory when empty.",
+                                subtype = 'DIR_PATH',
+                                default = "")
 
-class VoxelObject:
-    def __init__(self, Voxels, Size):
-        self.size = Size
-        self.voxels = {}
-        self.used_colors = []
-        self.position = Vec3(0, 0, 0)
-        self.rotation = Vec3(0, 0, 0)
+        cache_size: IntProperty(name = "Cache Size (MB)",
+                                description = "Least recently used entries are removed when the cache grows past this size.",
+                                default = 1024, min = 1)
 
-        for vox in Voxels:
-            #              x       y       z
-            pos = Vec3(vox[0], vox[1], vox[2])
-            self.voxels[pos._index()] = (pos, vox[3])
+        workers: IntProperty(name = "Worker Processes",
+                                description = "Number of processes that parse and mesh files when importing several at once. 0 uses one per CPU core.",
+                                default = 1, min = 0)
 
-            if vox[3] not in self.used_colors:
-                self.used_colors.append(vox[3])
+        report_timings: BoolProperty(name = "Report Timings",
+                                description = "Report how long each stage of the import took.",
+                                default = False)
 
+        profile_memory: BoolProperty(name = "Profile Memory",
+                                description = "Also record the peak memory of each stage. Slows down the import.",
+                                default = False)
 
-    def getVox(self, pos):
-        key = pos._index()
-        if key in self.voxels:
-            return self.voxels[key][1]
+        trace_file: StringProperty(name = "Trace File",
+                                description = "JSON file the timings of every imported file are written to. Nothing is written when empty.",
+                                subtype = 'FILE_PATH',
+                                default = "")
 
-        return 0
 
-    def compareVox(self, colA, b):
-        colB = self.getVox(b)
+        def execute(self, context):
+            paths = [os.path.join(self.directory, name.name) for name in self.files]
+            if not paths:
+                paths.append(self.filepath)
 
-        if colB == 0:
-            return False
-        return True
+            workers = self.workers or os.cpu_count()
 
-    def addLight(self, name, pos, light):
+            cache = None
+            if self.use_cache:
+                directory = bpy.path.abspath(self.cache_directory) or os.path.join(tempfile.gettempdir(), "magicavoxel_importer")
+                cache = MeshCache(directory, self.cache_size * 2**20)
 
-        return light_obj
+            profilers = [Profiler(path, self.profile_memory) for path in paths]
+            was_tracing = tracemalloc.is_tracing()
 
-    def generate(self, file_name, vox_size, material_type, palette, materials, cleanup, collections):
-        objects = []
-        lights = []
+            wm = context.window_manager
+            wm.progress_begin(0, len(paths))
 
-        self.materials = materials  # For helper functions.
+            totals = {}
+            traces = []
+            if self.proxies: # Nothing to mesh yet, skip the voxels.
+                files = ((VoxFile.load(path, voxels=False), None) for path in paths)
+            else:
+                files = prepare_files(paths, mesh_options(self), workers, cache, profilers)
 
-        mesh_col, light_col, volume_col = collections
+            for i, (vox, meshes) in enumerate(files):
+                stats = import_vox(vox, self, meshes, profilers[i])
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+                traces.append(profilers[i].finish())
+                wm.progress_update(i+1)
 
-        if len(self.used_colors) == 0: # Empty Object
-            return
+            wm.progress_end()
 
-        for Col in self.used_colors: # Create an object for each color and then join them.
+            if self.profile_memory and not was_tracing:
+                tracemalloc.stop()
 
-            mesh = bpy.data.meshes.new(file_name) # Create mesh
-            obj = bpy.data.objects.new(file_name, mesh) # Create object
+            if self.trace_file:
+                with open(bpy.path.abspath(self.trace_file), 'w') as file:
+                    json.dump({"files": traces}, file, indent=1)
 
-            # Create light data
-            if light_col != None and materials[Col-1][3] > 0:
-                light_data = bpy.data.lights.new(name=file_name+"_"+str(Col), type="POINT")
-                light_data.color = palette[Col-1][:3]
-                light_data.energy = materials[Col-1][3] * 500 * vox_size
-                light_data.specular_factor = 0  # Don't want circular reflections.
-                light_data.shadow_soft_size = vox_size/2
-                light_data.shadow_buffer_clip_start = vox_size
+            if self.create_volume and openvdb is None:
+                self.report({'WARNING'}, "OpenVDB Python module not found, glass and media voxels were meshed.")
 
-            # Link Object to Scene
-            if mesh_col == None:
-                bpy.context.scene.collection.objects.link(obj)
+            if self.proxies:
+                message = "Imported %d proxies" % totals["proxies"]
             else:
-                mesh_col.objects.link(obj)
-
-            objects.append(obj) # Keeps track of created objects for joining.
-
-            verts = []
-            faces = []
+                message = "Imported %d %s" % (totals["faces"], "points" if self.meshing == 'Points' else "faces")
+                if self.meshing == 'Greedy':
+                    message += " (%d before greedy meshing)" % totals["voxel_faces"]
+                if totals["lod_faces"]:
+                    message += ", %d LOD %s" % (totals["lod_faces"], "points" if self.meshing == 'Points' else "faces")
+            if self.create_lights:
+                message += ", %d lights for %d emissive voxels" % (totals["lights"], totals["emissive_voxels"])
+            if totals.get("volume_voxels"):
+                message += ", %d voxels in volumes" % totals["volume_voxels"]
+            self.report({'INFO'}, message)
+
+            if self.report_timings:
+                total = Profiler("total")
+                for profiler in profilers:
+                    total.merge(profiler)
+                stages = ", ".join("%s %.2fs" % (name, seconds) for name, (seconds, _, _) in total.stages.items())
+                self.report({'INFO'}, "%.2fs total: %s" % (total.total(), stages))
+
+            return {"FINISHED"}
+
+        def draw(self, context):
+            layout = self.layout
+
+            layout.prop(self, "voxel_size")
+
+            material_type = layout.column(align=True)
+            material_type.label(text = "Palette Import Method:")
+            material_type.prop(self, "material_type")
+
+            if self.material_type == 'SepMat':
+                layout.prop(self, "gamma_correct")
+                if self.gamma_correct:
+                    layout.prop(self, "gamma_value")
+            if self.material_type != 'None':
+                layout.prop(self, "override_materials")
+
+            layout.prop(self, "proxies")
+            layout.prop(self, "meshing")
+            layout.prop(self, "brick_size")
+            layout.row().prop(self, "lods")
+            layout.prop(self, "scene_culling")
+            layout.prop(self, "cleanup_mesh")
+            layout.prop(self, "create_lights")
+            if self.create_lights:
+                layout.prop(self, "light_cluster_size")
+                layout.prop(self, "max_lights")
+            layout.prop(self, "create_volume")
+            if self.create_volume and openvdb is None:
+                layout.label(text = "OpenVDB not found, volumes are meshed.", icon = 'ERROR')
+            layout.prop(self, "organize")
+
+            layout.prop(self, "use_cache")
+            if self.use_cache:
+                layout.prop(self, "cache_directory")
+                layout.prop(self, "cache_size")
+            layout.prop(self, "workers")
+
+            layout.prop(self, "report_timings")
+            layout.prop(self, "profile_memory")
+            layout.prop(self, "trace_file")
+
+    class RealizeVoxProxies(Operator):
+        bl_idname = "object.vox_realize_proxies"
+        bl_label = "Realize Voxel Proxies"
+        bl_description = "Replace the selected voxel proxies with meshes"
+        bl_options = {'REGISTER', 'UNDO'}
+
+        background: BoolProperty(name = "In Background",
+                                description = "Realize a few proxies at a time while Blender stays usable.",
+                                default = False)
 
-            for key in self.voxels:
-                pos, colID = self.voxels[key]
-                x, y, z = pos.x, pos.y, pos.z
+        def execute(self, context):
+            proxies = [obj for obj in context.selected_objects if "vox_path" in obj]
 
-                if colID != Col:
+            if self.background:
+                proxy_jobs.append(realize_steps(proxy_groups(proxies)))
+                if not bpy.app.timers.is_registered(realize_queued_proxies):
+                    bpy.app.timers.register(realize_queued_proxies)
+                self.report({'INFO'}, "Realizing %d proxies in the background" % len(proxies))
+            else:
+                self.report({'INFO'}, "Realized %d proxies" % realize_proxies(proxies))
+
+            return {"FINISHED"}
+
+    class ReimportVox(Operator):
+        bl_idname = "object.vox_reimport"
+        bl_label = "Reimport Voxel Files"
+        bl_description = "Update the meshes and materials of the selected voxel objects from their .vox files, only regenerating what changed"
+        bl_options = {'REGISTER', 'UNDO'}
+
+        def execute(self, context):
+            paths = set()
+            for obj in context.selected_objects:
+                if obj.type == 'MESH' and "vox_path" in obj.data:
+                    paths.add(obj.data["vox_path"])
+
+            if not paths:
+                self.report({'WARNING'}, "No imported voxel objects selected")
+                return {"CANCELLED"}
+
+            updated = checked = changed_materials = 0
+            for path in sorted(paths):
+                try:
+                    file_updated, file_checked, file_materials = sync_file(path)
+                except OSError as error:
+                    self.report({'ERROR'}, "Can't read %s: %s" % (path, error))
                     continue
+                updated += file_updated
+                checked += file_checked
+                changed_materials += file_materials
 
-                # Lights
-                if light_col != None and materials[Col-1][3] > 0:
-                    light_obj = bpy.data.objects.new(name=file_name+"_"+str(Col), object_data=light_data)
-                    light_obj.location = (x+0.5, y+0.5,z+0.5)  # Set location to center of voxel.
-                    light_col.objects.link(light_obj)
-                    lights.append(light_obj)
-
-
-                if not self.compareVox(colID, Vec3(x+1, y, z)):
-                    verts.append( (x+1, y, z) )
-                    verts.append( (x+1, y+1, z) )
-                    verts.append( (x+1, y+1, z+1) )
-                    verts.append( (x+1, y, z+1) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-                if not self.compareVox(colID, Vec3(x, y+1, z)):
-                    verts.append( (x+1, y+1, z) )
-                    verts.append( (x+1, y+1, z+1) )
-                    verts.append( (x, y+1, z+1) )
-                    verts.append( (x, y+1, z) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-                if not self.compareVox(colID, Vec3(x, y, z+1)):
-                    verts.append( (x, y, z+1) )
-                    verts.append( (x, y+1, z+1) )
-                    verts.append( (x+1, y+1, z+1) )
-                    verts.append( (x+1, y, z+1) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-                if not self.compareVox(colID, Vec3(x-1, y, z)):
-                    verts.append( (x, y, z) )
-                    verts.append( (x, y+1, z) )
-                    verts.append( (x, y+1, z+1) )
-                    verts.append( (x, y, z+1) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-                if not self.compareVox(colID, Vec3(x, y-1, z)):
-                    verts.append( (x, y, z) )
-                    verts.append( (x, y, z+1) )
-                    verts.append( (x+1, y, z+1) )
-                    verts.append( (x+1, y, z) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-                if not self.compareVox(colID, Vec3(x, y, z-1)):
-                    verts.append( (x, y, z) )
-                    verts.append( (x+1, y, z) )
-                    verts.append( (x+1, y+1, z) )
-                    verts.append( (x, y+1, z) )
-
-                    faces.append( [len(verts)-4,
-                                    len(verts)-3,
-                                    len(verts)-2,
-                                    len(verts)-1] )
-
-            mesh.from_pydata(verts, [], faces)
-
-            if material_type == 'SepMat':
-                obj.data.materials.append(bpy.data.materials.get(file_name + " #" + str(Col)))
-
-            elif material_type == 'VertCol':
-                obj.data.materials.append(bpy.data.materials.get(file_name))
-
-                # Create Vertex Colors
-                bpy.context.view_layer.objects.active = obj
-                bpy.ops.mesh.vertex_color_add() # Color
-                bpy.ops.mesh.vertex_color_add() # Materials
-                bpy.context.object.data.vertex_colors["Col.001"].name = "Mat"
-
-                # Set Vertex Colors
-                color_layer = mesh.vertex_colors["Col"]
-                material_layer = mesh.vertex_colors["Mat"]
-
-                i = 0
-                for poly in mesh.polygons:
-                    for idx in poly.loop_indices:
-                        color_layer.data[i].color = palette[Col-1]
-                        #                                                                                        Map emit value from [0,5] to [0,1]
-                        material_layer.data[i].color = [materials[Col-1][0], materials[Col-1][1], materials[Col-1][2], materials[Col-1][3]/5]
-                        i += 1
-
-            elif material_type == 'Tex':
-                obj.data.materials.append(bpy.data.materials.get(file_name))
-
-                # Create UVs
-                uv = obj.data.uv_layers.new(name="UVMap")
-                for loop in obj.data.loops:
-                    uv.data[loop.index].uv = [(Col-0.5)/256, 0.5]
-
-
-        bpy.ops.object.select_all(action='DESELECT')
-        for obj in objects:
-            obj.select_set(True) # Select all objects that were generated.
-
-        obj = objects[0]
-        bpy.context.view_layer.objects.active = obj # Make the first one active.
-        bpy.ops.object.join() # Join selected objects.
-
-        # Sets the origin of object to be the same as in MagicaVoxel so that its location can be set correctly.
-        bpy.context.scene.cursor.location = [0, 0, 0]
-        obj.location = [int(-self.size.x/2), int(-self.size.y/2), int(-self.size.z/2)]
-        bpy.ops.object.origin_set(type='ORIGIN_CURSOR', center='MEDIAN')
-
-        for light in lights:
-            light.parent = obj  # Parent Lights to Object
-            x, y, z = light.location  # Fix Location
-            light.location = [x+int(-self.size.x/2), y+int(-self.size.y/2), z+int(-self.size.z/2)]
-
-        # Set scale and position.
-        bpy.ops.transform.translate(value=(self.position.x*vox_size, self.position.y*vox_size, self.position.z*vox_size))
-        bpy.ops.transform.resize(value=(vox_size, vox_size, vox_size))
-
-        # Cleanup Mesh
-        if cleanup:
-            bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.remove_doubles()
-            bpy.ops.mesh.normals_make_consistent(inside=False)
-            bpy.ops.object.editmode_toggle()
-
+            self.report({'INFO'}, "Updated %d of %d meshes and %d materials" % (updated, checked, changed_materials))
+            return {"FINISHED"}
 
 ################################################################################################################################################
 ################################################################################################################################################
 
-def read_chunk(buffer):
-    *name, h_size, h_children = struct.unpack('<4cii', buffer.read(12))
-    name = b"".join(name)
-    content = bytearray(buffer.read(h_size))
-    return name, content
-
-def read_content(content, size):
-    out = content[:size]
-    del content[:size]
-
-    return out
+class VoxelObject:
+    def __init__(self, model):
+        self.model = model
+        self.size = tuple(model.size)
+        self.origin = np.array(model.size, dtype=np.int32) // 2  # MagicaVoxel rotates and positions models around their center voxel.
+
+        # Packed voxels, one row per voxel.
+        self.coords = np.ascontiguousarray(model.voxels[:, :3])  # (N, 3) uint8 x, y, z
+        self.colors = np.ascontiguousarray(model.voxels[:, 3])  # (N,) uint8 color id
+
+        # Color ids in use, in ascending order.
+        histogram = np.bincount(self.colors, minlength=256)
+        histogram[0] = 0
+        self.used_colors = np.flatnonzero(histogram).tolist()
+
+        # Datablocks made by generate() and generate_lod().
+        self.mesh = None
+        self.lod_meshes = {}  # {downsampling factor : mesh}
+        self.light_data = {}  # {color id : light}
+        self.cube_group = None  # Geometry Nodes group of point meshes, see cube_node_group().
+        self.volume = None
+
+        # Point lights of every instance, see plan_lights().
+        self.light_colors = np.zeros(0, dtype=np.uint8)
+        self.light_centers = np.zeros((0, 3))
+        self.light_counts = np.zeros(0, dtype=np.int64)
+
+    def generate(self, file_name, mesh_data, vox_size, material_type, palette, materials, profiler, material_name=None):
+        # Creates the mesh shared by every instance of this model, recording the time spent in
+        # profiler. material_name is the name the palette's materials were created under, the
+        # file name by default.
+        if len(self.used_colors) == 0: # Empty Object
+            return 0, 0
 
-def read_dict(content):
-    dict = {}
+        # Same origin as in MagicaVoxel so the position can be set directly.
+        mesh_data = MeshData(mesh_data.vertices - self.origin, mesh_data.faces, mesh_data.colors, mesh_data.voxel_faces)
 
-    dict_size, = struct.unpack('<i', read_content(content, 4))
-    for _ in range(dict_size):
-        key_bytes, = struct.unpack('<i', read_content(content, 4))
-        key = struct.unpack('<'+str(key_bytes)+'c', read_content(content, key_bytes))
-        key = b"".join(key)
+        with profiler.stage("create mesh"):
+            if mesh_data.points:
+                mesh = create_point_mesh(file_name, mesh_data, material_type, palette, materials)
+                self.cube_group = cube_node_group(material_type)
+            else:
+                mesh = create_mesh(file_name, mesh_data, material_type, palette, materials)
+
+        with profiler.stage("material slots"):
+            self.assign_materials(mesh, material_name or file_name, mesh_data, material_type)
+
+        # Light data, one per color and cluster size, shared by the lights of every instance.
+        stage = profiler.start("light data")
+        for Col, count in zip(self.light_colors.tolist(), self.light_counts.tolist()):
+            if (Col, count) in self.light_data:
+                continue
+
+            light_data = bpy.data.lights.new(name=file_name+"_"+str(Col), type="POINT")
+            light_data.color = palette[Col-1][:3]
+            light_data.energy = materials[Col-1][3] * 500 * vox_size * count
+            light_data.specular_factor = 0  # Don't want circular reflections.
+            light_data.shadow_soft_size = vox_size/2 * count**(1/3)
+            light_data.shadow_buffer_clip_start = vox_size
+            self.light_data[(Col, count)] = light_data
+        profiler.stop(stage)
+
+        self.mesh = mesh
+        return len(mesh_data.faces) or len(mesh_data.vertices), mesh_data.voxel_faces
+
+    def generate_lod(self, file_name, factor, mesh_data, material_type, palette, materials, profiler, material_name=None):
+        # Creates the mesh of a downsampled copy, using the same materials as the full mesh.
+        if len(mesh_data.faces) == 0 and not mesh_data.points:
+            return 0
+
+        mesh_data = MeshData(mesh_data.vertices - self.origin, mesh_data.faces, mesh_data.colors, mesh_data.voxel_faces)
+
+        with profiler.stage("create mesh"):
+            if mesh_data.points:
+                mesh = create_point_mesh(file_name + "_LOD" + str(factor), mesh_data, material_type, palette, materials)
+            else:
+                mesh = create_mesh(file_name + "_LOD" + str(factor), mesh_data, material_type, palette, materials)
+
+        with profiler.stage("material slots"):
+            self.assign_materials(mesh, material_name or file_name, mesh_data, material_type)
+
+        self.lod_meshes[factor] = mesh
+        return len(mesh_data.faces) or len(mesh_data.vertices)
+
+    def generate_volume(self, file_name, directory, densities, palette, material, profiler):
+        # Creates the volume of the glass and media voxels, which generate() left out of the
+        # mesh. Returns the number of voxels in it.
+        with profiler.stage("write volume"):
+            result = write_volume(directory, self.model, densities, palette)
+        if result is None:
+            return 0
+
+        path, count = result
+        volume = bpy.data.volumes.new(file_name + "_volume")
+        volume.filepath = path
+        volume.materials.append(material)
+
+        self.volume = volume
+        return count
+
+    def assign_materials(self, mesh, material_name, mesh_data, material_type):
+        if material_type == 'SepMat': # One material slot per used color.
+            for Col in self.used_colors:
+                mesh.materials.append(bpy.data.materials.get(material_name + " #" + str(Col)))
+
+            slots = np.zeros(256, dtype=np.int32)
+            slots[self.used_colors] = np.arange(len(self.used_colors))
+            if mesh_data.points: # Moved to the faces of the cubes by the Geometry Nodes modifier.
+                add_point_attribute(mesh, "vox_material_index", 'INT', "value", slots[mesh_data.colors])
+            else:
+                mesh.polygons.foreach_set("material_index", slots[mesh_data.colors])
 
-        value_bytes, = struct.unpack('<i', read_content(content, 4))
-        value = struct.unpack('<'+str(value_bytes)+'c', read_content(content, value_bytes))
-        value = b"".join(value)
+        elif material_type in ('VertCol', 'Tex'):
+            mesh.materials.append(bpy.data.materials.get(material_name))
 
-        dict[key] = value
+    def add_instance(self, file_name, matrix, collections):
+        # Creates an object using the shared mesh at one place in the scene, see instance_matrix().
+        if self.mesh is None:
+            return None
 
-    return dict
+        mesh_col, light_col, volume_col = collections
 
-def import_vox(path, options):
+        obj = bpy.data.objects.new(file_name, self.mesh) # Create object
 
-    with open(path, 'rb') as file:
-        file_name = os.path.basename(file.name).replace('.vox', '')
-        file_size = os.path.getsize(path)
+        # Link Object to Scene
+        if mesh_col == None:
+            bpy.context.scene.collection.objects.link(obj)
+        else:
+            mesh_col.objects.link(obj)
+
+        # Lights are children of the object and placed at the center of their cluster.
+        if light_col != None:
+            centers = self.light_centers - self.origin
+            for Col, count, location in zip(self.light_colors.tolist(), self.light_counts.tolist(), centers.tolist()):
+                light_obj = bpy.data.objects.new(name=file_name+"_"+str(Col), object_data=self.light_data[(Col, count)])
+                light_obj.parent = obj
+                light_obj.location = location
+                light_col.objects.link(light_obj)
+
+        if self.cube_group is not None:
+            add_cube_modifier(obj, self.cube_group, 1)
+
+        # The volume is a child of the object, like the lights.
+        if self.volume is not None:
+            volume_obj = bpy.data.objects.new(file_name + "_volume", self.volume)
+            volume_obj.parent = obj
+            (volume_col or mesh_col or bpy.context.scene.collection).objects.link(volume_obj)
+
+        # Set scale, rotation and position.
+        obj.matrix_world = matrix
+
+        return obj
+
+    def add_lod_instances(self, file_name, matrix, lod_cols):
+        # Creates an object for every LOD mesh at the same place as add_instance().
+        # lod_cols is {factor : collection}. Returns the objects.
+        objects = []
+        for factor, mesh in self.lod_meshes.items():
+            obj = bpy.data.objects.new(file_name + "_LOD" + str(factor), mesh)
+            lod_cols[factor].objects.link(obj)
+            if self.cube_group is not None: # Cubes as large as the downsampled voxels.
+                add_cube_modifier(obj, self.cube_group, factor)
+            obj.matrix_world = matrix
+            objects.append(obj)
+        return objects
 
-        palette = []
-        materials = [[0.5, 0.0, 0.0, 0.0] for _ in range(255)] # [roughness, metallic, glass, emission] * 255
 
-        # Makes sure it's supported vox file
-        assert (struct.unpack('<4ci', file.read(8)) == (b'V', b'O', b'X', b' ', 0xc8))
+################################################################################################################################################
+## VOX Document Model
+## Everything from here until the Blender Import section only needs numpy, so it can be used outside of Blender.
+
+class ChunkReader:
+    # Cursor over a memoryview. Values are unpacked in place so chunk contents are never copied.
+    def __init__(self, buffer, offset=0):
+        self.buffer = buffer
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.buffer, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def read(self, size):
+        out = self.buffer[self.offset:self.offset+size]
+        self.offset += size
+        return out
+
+    def read_string(self):
+        size, = self.unpack('<i')
+        return str(self.read(size), 'utf-8')
+
+    def read_dict(self):
+        dict = {}
+
+        dict_size, = self.unpack('<i')
+        for _ in range(dict_size):
+            key = self.read_string()
+            dict[key] = self.read_string()
+
+        return dict
+
+    def read_array(self, count, width):
+        # Decodes `count` rows of `width` bytes in one shot.
+        out = np.frombuffer(self.buffer, dtype=np.uint8, count=count*width, offset=self.offset)
+        self.offset += count*width
+        return out.reshape(count, width)
+
+def iter_file_chunks(file, offset, end=None, headers_only=(), names=None):
+    # Yields (name, content, content offset) for every chunk from offset to end, the end of the
+    # file by default, reading one chunk at a time. Children of the chunks are skipped, only MAIN
+    # has any. Chunks whose name isn't in names are skipped with a seek without being read. For
+    # chunk names in headers_only only the first 4 bytes of the content are read, like the voxel
+    # count of XYZI.
+    file.seek(0, 2)
+    end = file.tell() if end is None else min(end, file.tell())
+
+    while offset + 12 <= end:
+        file.seek(offset)
+        name, h_size, h_children = struct.unpack('<4sii', file.read(12))
+        offset += 12
+
+        if names is None or name in names:
+            content = file.read(min(h_size, 4) if name in headers_only else h_size)
+            yield name, ChunkReader(memoryview(content)), offset
+        offset += h_size + h_children
+
+class VoxModel:
+    def __init__(self, size, voxels, offset=None, count=None):
+        self.size = size  # (x, y, z)
+        self.voxels = voxels  # (N, 4) uint8 array of x, y, z, color id, None until loaded
+        self.offset = offset  # Byte offset of the XYZI voxel data in the file.
+        self.count = len(voxels) if voxels is not None else count
+
+    def load_voxels(self, path):
+        # Reads the voxels of a model that was loaded without them.
+        if self.voxels is None:
+            with open(path, 'rb') as file:
+                file.seek(self.offset)
+                data = file.read(self.count * 4)
+            self.voxels = np.frombuffer(data, dtype=np.uint8).reshape(self.count, 4)
+        return self.voxels
+
+    @property
+    def grid(self):
+        # Dense (x, y, z) uint8 array of color ids, 0 where empty. Built on every use and not
+        # kept, so only the models being worked on hold a grid.
+        grid = np.zeros(self.size, dtype=np.uint8)
+        x, y, z, col = self.voxels.T
+        grid[x, y, z] = col
+        return grid
+
+def default_palette():
+    # (256, 4) palette MagicaVoxel uses for files without an RGBA chunk: a 6x6x6 color cube
+    # without black, then ramps of red, green, blue and gray.
+    levels = (0xff, 0xcc, 0x99, 0x66, 0x33, 0x00)
+    colors = [(r, g, b) for r in levels for g in levels for b in levels][:-1]
+
+    ramp = (0xee, 0xdd, 0xbb, 0xaa, 0x88, 0x77, 0x55, 0x44, 0x22, 0x11)
+    colors += [(v, 0, 0) for v in ramp] + [(0, v, 0) for v in ramp] + [(0, 0, v) for v in ramp] + [(v, v, v) for v in ramp]
+
+    palette = np.zeros((256, 4), dtype=np.uint8)
+    palette[:255, :3] = colors
+    palette[:255, 3] = 255
+    return palette
+
+def is_hidden(attributes):
+    # Whether a node or layer is hidden, from its _hidden attribute.
+    return attributes.get('_hidden', '0') == '1'
+
+class Layer:
+    def __init__(self, id, attributes):
+        self.id = id
+        self.attributes = attributes  # _name, _hidden and _color
+
+    @property
+    def name(self):
+        return self.attributes.get('_name', "")
+
+    @property
+    def hidden(self):
+        return is_hidden(self.attributes)
+
+IDENTITY = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+
+def decode_rotation(value):
+    # 3x3 signed permutation matrix of a packed _r byte, as a tuple of rows. Bits 0-1 and 2-3
+    # are the column of the non-zero entry in the first and second row, the third row takes the
+    # remaining column. Bits 4, 5 and 6 make the entry of each row negative.
+    first, second = value & 3, (value >> 2) & 3
+    if first > 2 or second > 2 or first == second: # Not a rotation.
+        return IDENTITY
+
+    rows = []
+    for row, column in enumerate((first, second, 3 - first - second)):
+        entries = [0, 0, 0]
+        entries[column] = -1 if value >> (4 + row) & 1 else 1
+        rows.append(tuple(entries))
+    return tuple(rows)
+
+def compose(parent, child):
+    # (rotation, translation) of applying the child transform and then the parent one.
+    (parent_rotation, parent_translation), (rotation, translation) = parent, child
+    if rotation == IDENTITY and parent_rotation == IDENTITY: # Nearly every node.
+        return IDENTITY, tuple(a + b for a, b in zip(parent_translation, translation))
+
+    (a, b, c), (d, e, f), (g, h, i) = rotation
+    x, y, z = translation
+    rows = []
+    for (p, q, r), offset in zip(parent_rotation, parent_translation):
+        rows.append(((p*a + q*d + r*g, p*b + q*e + r*h, p*c + q*f + r*i), p*x + q*y + r*z + offset))
+    return tuple(row for row, _ in rows), tuple(offset for _, offset in rows)
+
+def frame_transform(frame):
+    # (rotation, translation) of a frame dict of an nTRN chunk.
+    rotation = decode_rotation(int(frame['_r'])) if '_r' in frame else IDENTITY
+    x, y, z = frame.get('_t', "0 0 0").split()
+    return rotation, (int(x), int(y), int(z))
+
+class TransformNode:
+    def __init__(self, id, attributes, child_id, layer_id, frames):
+        self.id = id
+        self.attributes = attributes
+        self.child_id = child_id
+        self.layer_id = layer_id
+        self.frames = frames  # [{property : value}]
+
+    @property
+    def transform(self):
+        # (rotation, translation) of the first frame.
+        return frame_transform(self.frames[0]) if self.frames else (IDENTITY, (0, 0, 0))
+
+    @property
+    def translation(self):
+        return self.transform[1]
+
+    @property
+    def rotation(self):
+        return self.transform[0]
+
+    @property
+    def animated(self):
+        return len(self.frames) > 1
+
+    def keyframes(self):
+        # [(frame index, (rotation, translation))] in frame order.
+        return sorted(((int(frame.get('_f', 0)), frame_transform(frame)) for frame in self.frames), key=lambda key: key[0])
+
+    def transform_at(self, frame):
+        # Transform of the last keyframe at or before frame. Keys hold until the next one.
+        keyframes = self.keyframes()
+        transform = keyframes[0][1]
+        for key, key_transform in keyframes:
+            if key > frame:
+                break
+            transform = key_transform
+        return transform
+
+class GroupNode:
+    def __init__(self, id, attributes, children):
+        self.id = id
+        self.attributes = attributes
+        self.children = children  # [node id]
+
+class ShapeNode:
+    def __init__(self, id, attributes, models):
+        self.id = id
+        self.attributes = attributes
+        self.models = models  # [(model id, {property : value})]
+
+class SceneInstance:
+    # One use of a model in the scene. The model is rotated around its origin voxel, see
+    # VoxelObject, then moved by translation.
+    def __init__(self, model_id, translation, transform_id, keyframes=(), model_frames=(), rotation=IDENTITY):
+        self.model_id = model_id  # Model of the first frame when there are model_frames.
+        self.translation = translation  # (x, y, z) in voxels
+        self.rotation = rotation  # 3x3 signed permutation matrix as a tuple of rows.
+        self.transform_id = transform_id  # Transform node directly above the shape, None if the file has no scene graph.
+        self.keyframes = list(keyframes)  # [(frame index, translation, rotation)] when a transform above it is animated.
+        self.model_frames = list(model_frames)  # [(frame index, model id)] when the shape has a model per frame.
+
+def used_models(instances):
+    # Ids of the models used by instances, including the models of every frame.
+    used = set(instance.model_id for instance in instances)
+    for instance in instances:
+        used.update(model_id for _, model_id in instance.model_frames)
+    return used
+
+class VoxFile:
+    def __init__(self, name=""):
+        self.name = name
+        self.path = None  # Set when loaded from a file.
+
+        self.models = []  # [VoxModel], indexed by model id
+        self.palette = None  # (256, 4) uint8 array of RGBA, entry i is color id i+1, see default_palette()
+        self.index_map = None  # (256,) uint8 array, the palette position shown for each color id, from IMAP.
+        self.materials = {}  # {material id : {property : value}}
+        self.layers = {}  # {layer id : Layer}
+        self.render_objects = []  # [{property : value}], render settings from rOBJ.
+        self.cameras = {}  # {camera id : {property : value}}
+        self.notes = []  # [str], names of the palette rows from NOTE.
+
+        # Scene Graph {node id : node}
+        self.transforms = {}
+        self.groups = {}
+        self.shapes = {}
+
+        self._size = None  # Size of the model whose XYZI comes next.
+
+    @classmethod
+    def load(cls, path, voxels=True):
+        # Reads the file one chunk at a time, skipping chunks that aren't read into the document
+        # without loading them. Without voxels, the voxel data of the models is skipped too and
+        # can be read later with VoxModel.load_voxels().
+        vox = cls(os.path.basename(path).replace('.vox', ''))
+        vox.path = path
+
+        with open(path, 'rb') as file:
+            start, end = vox.check_header(file.read(20))
+            headers_only = () if voxels else (b'XYZI',)
+            vox.read_chunks(iter_file_chunks(file, start, end, headers_only, cls.CHUNK_READERS))
+
+        return vox
+
+    @staticmethod
+    def check_header(data):
+        # Makes sure it's supported vox file. Returns the start and end offsets of the
+        # children of the MAIN chunk.
+        assert (struct.unpack_from('<4si', data, 0) == (b'VOX ', 0xc8))
 
         # MAIN chunk
-        assert (struct.unpack('<4c', file.read(4)) == (b'M', b'A', b'I', b'N'))
-        N, M = struct.unpack('<ii', file.read(8))
-        assert (N == 0)
-
-        models = {}  # {model id : VoxelObject}
-        mod_id = 0
-
-        transforms = {}  # Transform Node {child id : [location, rotation]}
-        groups = {}  # Group Node {id : [children ids]}
-        shapes = {}  # Shape Node {id : [model ids]}
-
-        ### Parse File ###
-        while file.tell() < file_size:
-            name, content = read_chunk(file)
-
-            if name == b'SIZE': # Size of object.
-                x, y, z = struct.unpack('<3i', read_content(content, 12))
-                size = Vec3(x, y, z)
-
-            elif name == b'XYZI': # Location and color id of voxel.
-                voxels = []
-
-                num_voxels, = struct.unpack('<i', read_content(content, 4))
-                for voxel in range(num_voxels):
-                    voxel_data = struct.unpack('<4B', read_content(content, 4))
-                    voxels.append(voxel_data)
-
-                model = VoxelObject(voxels, size)
-                models[mod_id] = model
-                mod_id += 1
-
-
-            elif name == b'nTRN': # Position and rotation of object.
-                id, = struct.unpack('<i', read_content(content, 4))
-
-                # Don't need node attributes.
-                _ = read_dict(content)
-
-                child_id, _, _, _, = struct.unpack('<4i', read_content(content, 16))
-                transforms[child_id] = [Vec3(0, 0, 0), Vec3(0, 0, 0)]
-
-                frames = read_dict(content)
-                for key in frames:
-                    if key == b'_r':  # Rotation
-                        pass # Can't figure out how to read rotation.
-
-                    elif key == b'_t':  # Translation
-                        value = frames[key].decode('utf-8').split()
-                        transforms[child_id][0] = Vec3(int(value[0]), int(value[1]), int(value[2]))
-
-            elif name == b'nGRP':
-                id, = struct.unpack('<i', read_content(content, 4))
-
-                # Don't need node attributes.
-                _ = read_dict(content)
-
-                num_child, = struct.unpack('<i', read_content(content, 4))
-                children = []
-
-                for _ in range(num_child):
-                    children.append(struct.unpack('<i', read_content(content, 4))[0])
-
-                groups[id] = children
-
-            elif name == b'nSHP':
-                id, = struct.unpack('<i', read_content(content, 4))
-
-                # Don't need node attributes.
-                _ = read_dict(content)
-
-                num_models, = struct.unpack('<i', read_content(content, 4))
-                model_ids = []
-
-                for _ in range(num_models):
-                    model_ids.append(struct.unpack('<i', read_content(content, 4))[0])
-                    _ = read_dict(content)  # Don't need model attributes.
-
-                shapes[id] = model_ids
-
-            elif name == b'RGBA':
-                for _ in range(255):
-                    rgba = struct.unpack('<4B', read_content(content, 4))
-                    palette.append([float(col)/255 for col in rgba])
-                del content[:4] # Contains a 256th color for some reason.
+        assert (struct.unpack_from('<4s', data, 8) == (b'MAIN',))
+        N, M = struct.unpack_from('<ii', data, 12)
+        return 20 + N, 20 + N + M
+
+    def read_chunks(self, chunks):
+        # Reads the (name, content, content offset) of the chunks inside MAIN with the reader in
+        # CHUNK_READERS for their name. Other chunks are ignored.
+        for name, content, offset in chunks:
+            reader = self.CHUNK_READERS.get(name)
+            if reader is not None:
+                reader(self, content, offset)
+
+        if self.palette is None:
+            self.palette = default_palette()
+
+    def read_size(self, content, offset): # Size of object.
+        self._size = content.unpack('<3i')
+
+    def read_voxels(self, content, offset): # Location and color id of voxel.
+        num_voxels, = content.unpack('<i')
+        if len(content.buffer) < 4 + num_voxels*4: # Only the header was read.
+            self.models.append(VoxModel(self._size, None, offset + 4, num_voxels))
+        else:
+            voxels = content.read_array(num_voxels, 4)
+            self.models.append(VoxModel(self._size, voxels, offset + 4))
+
+    def read_transform(self, content, offset): # Position and rotation of object.
+        id, = content.unpack('<i')
+        attributes = content.read_dict()
+        child_id, _, layer_id, num_frames = content.unpack('<4i')
+        frames = [content.read_dict() for _ in range(num_frames)]
+
+        self.transforms[id] = TransformNode(id, attributes, child_id, layer_id, frames)
+
+    def read_group(self, content, offset):
+        id, = content.unpack('<i')
+        attributes = content.read_dict()
+        num_child, = content.unpack('<i')
+        children = list(content.unpack('<'+str(num_child)+'i'))
+
+        self.groups[id] = GroupNode(id, attributes, children)
+
+    def read_shape(self, content, offset):
+        id, = content.unpack('<i')
+        attributes = content.read_dict()
+        num_models, = content.unpack('<i')
+        models = []
+
+        for _ in range(num_models):
+            model_id, = content.unpack('<i')
+            models.append((model_id, content.read_dict()))
+
+        self.shapes[id] = ShapeNode(id, attributes, models)
+
+    def read_layer(self, content, offset):
+        id, = content.unpack('<i')
+        self.layers[id] = Layer(id, content.read_dict())
+
+    def read_palette(self, content, offset):
+        self.palette = content.read_array(256, 4).copy()
+
+    def read_index_map(self, content, offset):
+        self.index_map = content.read_array(256, 1).ravel().copy()
+
+    def read_material(self, content, offset):
+        id, = content.unpack('<i')
+        self.materials[id] = content.read_dict()
+
+    def read_render_object(self, content, offset):
+        self.render_objects.append(content.read_dict())
+
+    def read_camera(self, content, offset):
+        id, = content.unpack('<i')
+        self.cameras[id] = content.read_dict()
+
+    def read_notes(self, content, offset):
+        num_notes, = content.unpack('<i')
+        self.notes = [content.read_string() for _ in range(num_notes)]
+
+    # {chunk name : reader}, chunks missing here are skipped.
+    CHUNK_READERS = {
+        b'SIZE': read_size,
+        b'XYZI': read_voxels,
+        b'nTRN': read_transform,
+        b'nGRP': read_group,
+        b'nSHP': read_shape,
+        b'LAYR': read_layer,
+        b'RGBA': read_palette,
+        b'IMAP': read_index_map,
+        b'MATL': read_material,
+        b'rOBJ': read_render_object,
+        b'rCAM': read_camera,
+        b'NOTE': read_notes,
+    }
+
+    def hidden(self, node):
+        # Whether a transform or group node is hidden, by itself or by its layer.
+        if is_hidden(node.attributes):
+            return True
+        layer = self.layers.get(getattr(node, "layer_id", -1))
+        return layer is not None and layer.hidden
+
+    def instances(self):
+        # [SceneInstance] for every shape reference in the scene graph. World transforms are
+        # composed down the tree in one pass, each node starting from the transform of its
+        # parent. Below an animated transform the nodes are kept as a chain instead and composed
+        # again for every keyframe. Shapes with several models are one instance with a model for
+        # each frame. Nothing below hidden nodes or nodes on hidden layers is used. Models that
+        # aren't referenced by any shape are placed once at the origin.
+        instances = []
+
+        children = set(node.child_id for node in self.transforms.values())
+        for group in self.groups.values():
+            children.update(group.children)
+        roots = [id for id in self.transforms if id not in children]
+
+        origin = (IDENTITY, (0, 0, 0))
+        stack = [(id, origin, None, ()) for id in reversed(roots)]
+        while stack:
+            id, parent, transform_id, chain = stack.pop()
+
+            if id in self.transforms:
+                node = self.transforms[id]
+                if self.hidden(node):
+                    continue
+                if chain or node.animated:
+                    stack.append((node.child_id, parent, id, chain + (node,)))
+                else:
+                    stack.append((node.child_id, compose(parent, node.transform), id, chain))
 
-            elif name == b'MATL':
-                id, = struct.unpack('<i', read_content(content, 4))
-                if id > 255: continue # Why are there material values for id 256?
+            elif id in self.groups:
+                if self.hidden(self.groups[id]):
+                    continue
+                for child_id in reversed(self.groups[id].children):
+                    stack.append((child_id, parent, transform_id, chain))
+
+            elif id in self.shapes:
+                keyframes = []
+                if chain:
+                    frames = sorted(set(frame for node in chain if node.animated for frame, _ in node.keyframes()))
+                    for frame in frames:
+                        transform = parent
+                        for node in chain:
+                            transform = compose(transform, node.transform_at(frame))
+                        keyframes.append((frame, transform[1], transform[0]))
+
+                rotation, translation = (keyframes[0][2], keyframes[0][1]) if keyframes else parent
+                models = self.shapes[id].models
+
+                if len(models) > 1: # A model per frame.
+                    model_frames = sorted((int(attributes.get('_f', i)), model_id) for i, (model_id, attributes) in enumerate(models))
+                    instances.append(SceneInstance(model_frames[0][1], translation, transform_id, keyframes, model_frames, rotation))
+                else:
+                    for model_id, _ in models:
+                        instances.append(SceneInstance(model_id, translation, transform_id, keyframes, rotation=rotation))
+
+        used = set(model_id for shape in self.shapes.values() for model_id, _ in shape.models)
+        for model_id in range(len(self.models)):
+            if model_id not in used:
+                instances.append(SceneInstance(model_id, (0, 0, 0), None))
+
+        return instances
+
+    def material_properties(self):
+        # [roughness, metallic, glass, emission] for each of the 255 colors.
+        materials = [[0.5, 0.0, 0.0, 0.0] for _ in range(255)]
+
+        for id, mat_dict in self.materials.items():
+            if not 0 < id <= 255: continue # Why are there material values for id 256?
+
+            type = None
+            for key, value in mat_dict.items():
+                if key == '_type':
+                    type = value
+
+                if key == '_rough':
+                    materials[id-1][0] = float(value) # Roughness
+                elif key == '_metal' and type == '_metal':
+                    materials[id-1][1] = float(value) # Metalic
+                elif key == '_alpha' and type == '_glass':
+                    materials[id-1][2] = float(value) # Glass
+                elif key == '_emit' and type == '_emit':
+                    materials[id-1][3] = float(value) # Emission
+                elif key == '_flux':
+                    materials[id-1][3] *= float(value)+1 # Emission Power
+
+        return materials
+
+    def volume_densities(self):
+        # (256,) density of each color id when imported as a volume, 0 for colors that aren't
+        # glass or media.
+        densities = np.zeros(256, dtype=np.float32)
+
+        for id, mat_dict in self.materials.items():
+            if not 0 < id <= 255: continue
+
+            type = mat_dict.get('_type')
+            if type == '_glass': # Fully transparent glass still needs some density to be kept.
+                densities[id] = max(1 - float(mat_dict.get('_alpha', 0)), 0.01)
+            elif type == '_media':
+                densities[id] = max(float(mat_dict.get('_d', 1)), 0.01)
+
+        return densities
 
-                mat_dict = read_dict(content)
+################################################################################################################################################
+## Meshing
+
+# (axis, sign) of each face direction.
+FACE_DIRECTIONS = ((0, 1), (1, 1), (2, 1), (0, -1), (1, -1), (2, -1))
+
+class MeshData:
+    def __init__(self, vertices, faces, colors, voxel_faces):
+        self.vertices = vertices  # (V, 3) int32 array of positions in voxel units
+        self.faces = faces  # (F, 4) int32 array of vertex indices
+        self.colors = colors  # (F,) uint8 array of the color id of each face
+        self.voxel_faces = voxel_faces  # Number of exposed voxel faces before any merging.
+
+    @staticmethod
+    def empty():
+        return MeshData(np.zeros((0, 3), dtype=np.int32), np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.uint8), 0)
+
+    @property
+    def points(self):
+        # Made by mesh_points(), with a color per vertex and no faces.
+        return len(self.faces) == 0 and len(self.colors) > 0
+
+def exposed_faces(padded, offset=(0, 0, 0)):
+    # Yields (axis, sign, cells, colors) for every face direction, where cells are the (F, 3)
+    # coordinates of filled voxels whose neighbor in that direction is empty. padded is a color
+    # grid with a one voxel border of neighbors around it, offset is added to the coordinates.
+    inner = padded[1:-1, 1:-1, 1:-1]
+    filled = inner != 0
+
+    for axis, sign in FACE_DIRECTIONS:
+        neighbor = [slice(1, -1)] * 3
+        neighbor[axis] = slice(1+sign, padded.shape[axis]-1+sign)
+
+        mask = filled & (padded[tuple(neighbor)] == 0)
+        yield axis, sign, np.argwhere(mask).astype(np.int32) + np.array(offset, dtype=np.int32), inner[mask]
+
+def bricks(voxels, size, brick_size):
+    # Splits the (N, 4) voxels of a model of the given size into bricks of brick_size^3 voxels,
+    # yielding each non-empty brick as a padded block for exposed_faces() along with its position.
+    # The voxels are sorted by brick, so no dense grid of the whole model is needed. Each block
+    # holds a one voxel border taken from the faces of the neighboring bricks so faces between
+    # bricks are culled correctly. The block is reused, so it's only valid until the next brick.
+    counts = -(-np.array(size) // brick_size) # Bricks along each axis, rounded up.
+    # int64, since uint8 positions would wrap with more than 256 bricks.
+    keys = voxels[:, 0].astype(np.int64) // brick_size
+    for axis in (1, 2):
+        keys *= counts[axis]
+        keys += voxels[:, axis].astype(np.int64) // brick_size
+
+    order = np.argsort(keys, kind='stable') # Stable, so a repeated position keeps its last color.
+    voxels = voxels[order]
+    keys = keys[order]
+    del order
+
+    # Range of the sorted voxels in every non-empty brick.
+    brick_keys, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(keys))
+    del keys
+
+    def voxel_range(key):
+        index = np.searchsorted(brick_keys, key)
+        if index < len(brick_keys) and brick_keys[index] == key:
+            return voxels[starts[index]:ends[index]]
+        return None
+
+    padded = np.zeros((brick_size+2,)*3, dtype=np.uint8)
+    strides = (counts[1] * counts[2], counts[2], 1)
+
+    for key, start, end in zip(brick_keys, starts, ends):
+        position = np.array((key // strides[0], key // strides[1] % counts[1], key % counts[2]))
+        low = position * brick_size
+        high = np.minimum(low + brick_size, size)
+
+        padded[:] = 0
+        part = voxels[start:end]
+        cells = part[:, :3].astype(np.int32) - low + 1
+        padded[cells[:, 0], cells[:, 1], cells[:, 2]] = part[:, 3]
+
+        # Border, from the voxels on the touching face of each neighbor.
+        for axis, sign in FACE_DIRECTIONS:
+            if not 0 <= position[axis] + sign < counts[axis]:
+                continue
+            part = voxel_range(key + sign * strides[axis])
+            if part is None:
+                continue
+
+            part = part[part[:, axis] == (low[axis] - 1 if sign < 0 else high[axis])]
+            cells = part[:, :3].astype(np.int32) - low + 1
+            padded[cells[:, 0], cells[:, 1], cells[:, 2]] = part[:, 3]
+
+        # Bricks at the far edges of the model can be smaller.
+        edge = high - low
+        yield padded[:edge[0]+2, :edge[1]+2, :edge[2]+2], low
+
+def group_starts(same):
+    # Indices where a new group starts, given whether each element continues the previous one.
+    starts = np.ones(len(same)+1, dtype=bool)
+    starts[1:] = ~same
+    return np.flatnonzero(starts)
+
+def merge_faces(axis, cells, colors):
+    # Greedy meshing of the faces of one direction. Faces are merged into runs along v first,
+    # then runs with the same start, length and color on consecutive rows along u are stacked.
+    # Returns the (R, 3) origin cells, u sizes, v sizes and colors of the merged rectangles.
+    if len(cells) == 0:
+        return cells, np.ones(0, dtype=np.int32), np.ones(0, dtype=np.int32), colors
+
+    u, v = (axis+1) % 3, (axis+2) % 3
+
+    # Runs along v.
+    order = np.lexsort((cells[:, v], cells[:, u], cells[:, axis]))
+    cells, colors = cells[order], colors[order]
+
+    same = ((cells[1:, axis] == cells[:-1, axis]) & (cells[1:, u] == cells[:-1, u])
+            & (cells[1:, v] == cells[:-1, v]+1) & (colors[1:] == colors[:-1]))
+    starts = group_starts(same)
+    lengths = np.diff(np.append(starts, len(cells))).astype(np.int32)
+    cells, colors = cells[starts], colors[starts]
+
+    # Stack runs along u.
+    order = np.lexsort((cells[:, u], lengths, cells[:, v], colors, cells[:, axis]))
+    cells, colors, lengths = cells[order], colors[order], lengths[order]
+
+    same = ((cells[1:, axis] == cells[:-1, axis]) & (colors[1:] == colors[:-1]) & (cells[1:, v] == cells[:-1, v])
+            & (lengths[1:] == lengths[:-1]) & (cells[1:, u] == cells[:-1, u]+1))
+    starts = group_starts(same)
+    heights = np.diff(np.append(starts, len(cells))).astype(np.int32)
+
+    return cells[starts], heights, lengths[starts], colors[starts]
+
+def face_quads(axis, sign, cells, u_size=1, v_size=1):
+    # (F, 4, 3) corners of the faces on the given side of each cell, spanning u_size by v_size
+    # cells and wound counter-clockwise when looking at the face from outside.
+    u, v = (axis+1) % 3, (axis+2) % 3
+
+    corners = np.repeat(cells[:, np.newaxis, :], 4, axis=1)
+    if sign > 0:
+        corners[:, :, axis] += 1
+
+    corners[:, 1:3, u] += np.reshape(u_size, (-1, 1))
+    corners[:, 2:4, v] += np.reshape(v_size, (-1, 1))
+
+    if sign < 0:
+        corners = corners[:, ::-1]
+
+    return corners
+
+def weld_vertices(vertices, faces):
+    # Merges vertices at the same position. Positions are integers inside the grid, so each one
+    # has a unique integer key and np.unique does the merging.
+    dims = vertices.max(axis=0).astype(np.int64) + 1 if len(vertices) else np.ones(3, dtype=np.int64)
+    keys = vertices[:, 0] + dims[0] * (vertices[:, 1] + dims[1] * vertices[:, 2].astype(np.int64))
+
+    keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return vertices[first], inverse.reshape(-1).astype(np.int32)[faces]
+
+def mesh_faces(face_sets, greedy=False, weld=False):
+    # Builds MeshData from the (axis, sign, cells, colors) sets of exposed_faces().
+    # Each set is turned into quads right away, so only the finished quads are kept. With weld,
+    # faces share vertices instead of every face having its own 4.
+    quads = []
+    colors = []
+    voxel_faces = 0
+
+    for axis, sign, cells, cell_colors in face_sets:
+        voxel_faces += len(cells)
+
+        if greedy:
+            cells, u_size, v_size, cell_colors = merge_faces(axis, cells, cell_colors)
+            quads.append(face_quads(axis, sign, cells, u_size, v_size))
+        else:
+            quads.append(face_quads(axis, sign, cells))
+
+        colors.append(cell_colors)
+
+    vertices = np.concatenate(quads).reshape(-1, 3)
+    faces = np.arange(len(vertices), dtype=np.int32).reshape(-1, 4)
+
+    if weld:
+        vertices, faces = weld_vertices(vertices, faces)
+
+    return MeshData(vertices, faces, np.concatenate(colors), voxel_faces)
+
+def cull_faces(face_sets, hidden):
+    # Removes the faces hidden(axis, sign, cells) is true for from exposed_faces() sets.
+    for axis, sign, cells, colors in face_sets:
+        keep = ~hidden(axis, sign, cells)
+        yield axis, sign, cells[keep], colors[keep]
+
+def mesh_grid(grid, greedy=False, weld=False, hidden=None):
+    # Meshes the exposed faces of every color of a dense grid at once. hidden is an optional
+    # cull_faces() test for faces covered by something outside the grid.
+    face_sets = exposed_faces(np.pad(grid, 1))
+    if hidden is not None:
+        face_sets = cull_faces(face_sets, hidden)
+
+    return mesh_faces(face_sets, greedy, weld)
+
+def mesh_bricks(voxels, size, brick_size, greedy=False, weld=False, hidden=None):
+    # Meshes the (N, 4) voxels of a model brick by brick, so the temporary arrays only ever
+    # cover one brick instead of the whole model. Greedy merging doesn't cross brick borders. With weld, every
+    # brick is welded on its own first, which leaves only the vertices along the borders for
+    # the final weld.
+    parts = []
+    for block, low in bricks(voxels, size, brick_size):
+        face_sets = exposed_faces(block, low)
+        if hidden is not None:
+            face_sets = cull_faces(face_sets, hidden)
+        parts.append(mesh_faces(face_sets, greedy, weld))
+
+    if not parts: # No voxels.
+        return mesh_grid(np.zeros((0, 0, 0), dtype=np.uint8), greedy, weld)
+
+    offsets = np.cumsum([0] + [len(part.vertices) for part in parts[:-1]], dtype=np.int32)
+    vertices = np.concatenate([part.vertices for part in parts])
+    faces = np.concatenate([part.faces + offset for part, offset in zip(parts, offsets)])
+    colors = np.concatenate([part.colors for part in parts])
+    voxel_faces = sum(part.voxel_faces for part in parts)
+    del parts
+
+    if weld:
+        vertices, faces = weld_vertices(vertices, faces)
+
+    return MeshData(vertices, faces, colors, voxel_faces)
+
+def mesh_points(coords, colors):
+    # MeshData of the Points meshing mode, a vertex at the center of every voxel and no faces.
+    # colors holds the color id of every vertex instead of every face.
+    vertices = coords.astype(np.float32) + 0.5
+    return MeshData(vertices, np.zeros((0, 4), dtype=np.int32), np.ascontiguousarray(colors, dtype=np.uint8), 0)
+
+def mesh_model(model, options, grid=None, hidden=None, skip=None):
+    # MeshData of a VoxModel, or of grid in its place. With a brick size the model is meshed
+    # brick by brick, which bounds the memory used while meshing. skip is a (256,) mask of
+    # color ids whose voxels are left out, like the ones imported as volumes.
+    if skip is not None and not skip.any():
+        skip = None
+
+    if options.points: # Nothing to mesh, Blender turns the points into cubes.
+        if grid is None:
+            voxels = model.voxels if skip is None else model.voxels[~skip[model.voxels[:, 3]]]
+            return mesh_points(voxels[:, :3], voxels[:, 3])
+        cells = np.argwhere(grid if skip is None else grid * ~skip[grid])
+        return mesh_points(cells, grid[cells[:, 0], cells[:, 1], cells[:, 2]])
+
+    if options.brick_size:
+        if grid is None:
+            voxels, size = model.voxels, model.size
+        else:
+            cells = np.argwhere(grid).astype(np.uint8)
+            voxels, size = np.column_stack((cells, grid[cells[:, 0], cells[:, 1], cells[:, 2]])), grid.shape
+        if skip is not None:
+            voxels = voxels[~skip[voxels[:, 3]]]
+        return mesh_bricks(voxels, size, options.brick_size, options.greedy, options.weld, hidden)
+
+    if grid is None:
+        grid = model.grid
+    if skip is not None:
+        grid = grid * ~skip[grid]
+
+    return mesh_grid(grid, options.greedy, options.weld, hidden)
+
+class SceneOcclusion:
+    # Index of the voxels of every instance in world coordinates, used to find the faces of a
+    # model that are covered by the voxels of other models in the scene, like the seams between
+    # tiles of a large world. Only voxels next to or inside the bounds of another instance are
+    # indexed, since no other voxels can touch a different model.
+    def __init__(self, models, instances, skip=None):
+        # skip is a (256,) mask of color ids whose voxels don't hide anything, see mesh_model().
+        self.isolated = set()  # Models with an instance that doesn't touch any other.
+
+        # Animated instances move or change shape, so they neither hide faces nor have them hidden.
+        for instance in instances:
+            if instance.keyframes or instance.model_frames:
+                self.isolated.add(instance.model_id)
+                self.isolated.update(model_id for _, model_id in instance.model_frames)
+        instances = [instance for instance in instances if not (instance.keyframes or instance.model_frames)]
+
+        # World position of a voxel is position @ rotation.T + shift, see placement().
+        placements = [self.placement(models[instance.model_id], instance) for instance in instances]
+        self.instances = {}  # {model id : [(rotation, shift)] of each instance}
+        for instance, placement in zip(instances, placements):
+            self.instances.setdefault(instance.model_id, []).append(placement)
+
+        # World bounds of every instance, from the positions of its first and last voxel.
+        low = np.zeros((len(instances), 3), dtype=np.int64)
+        high = np.zeros((len(instances), 3), dtype=np.int64)
+        for i, (instance, (rotation, shift)) in enumerate(zip(instances, placements)):
+            corners = np.array([(0, 0, 0), np.array(models[instance.model_id].size) - 1]) @ rotation.T + shift
+            low[i], high[i] = corners.min(axis=0), corners.max(axis=0) + 1
+
+        # Keys are positions in a box around every instance, with room for neighbors.
+        self.low = low.min(axis=0) - 1 if len(low) else np.zeros(3, dtype=np.int64)
+        self.dims = (high.max(axis=0) + 1 if len(high) else np.ones(3, dtype=np.int64)) - self.low
+
+        keys = [np.zeros(0, dtype=np.int64)]
+        for i, instance in enumerate(instances):
+            # Other instances whose bounds, grown by one voxel, overlap this one.
+            touching = np.all((low - 1 < high[i]) & (low[i] < high + 1), axis=1)
+            touching[i] = False
+
+            if not touching.any():
+                self.isolated.add(instance.model_id)
+                continue
+
+            # Voxels of this instance inside the grown bounds of each of them.
+            voxels = models[instance.model_id].voxels
+            if skip is not None:
+                voxels = voxels[~skip[voxels[:, 3]]]
+            rotation, shift = placements[i]
+            for j in np.flatnonzero(touching):
+                # The overlap in world space, turned back into a box of model positions.
+                world = np.array([np.maximum(low[i], low[j] - 1), np.minimum(high[i], high[j] + 1) - 1])
+                local = (world - shift) @ rotation # Inverse of the placement, rotations are orthogonal.
+                start, end = local.min(axis=0), local.max(axis=0) + 1
+
+                inside = np.all((voxels[:, :3] >= start) & (voxels[:, :3] < end), axis=1)
+                cells = voxels[inside, :3].astype(np.int64)
+                keys.append(self.key(cells @ rotation.T + shift))
+
+        self.keys = np.unique(np.concatenate(keys))
+
+    @staticmethod
+    def placement(model, instance):
+        # (rotation, shift) placing the voxels of a model instance in world space. A voxel spans
+        # position - origin to position - origin + 1 in the model, see VoxelObject. Rotated, its
+        # lowest corner moves by -1 along every axis that's flipped.
+        rotation = np.array(instance.rotation, dtype=np.int64)
+        origin = np.array(model.size, dtype=np.int64) // 2
+        shift = np.array(instance.translation, dtype=np.int64) - rotation @ origin + np.minimum(rotation.sum(axis=1), 0)
+        return rotation, shift
+
+    def key(self, positions):
+        positions = positions - self.low
+        return (positions[:, 0] * self.dims[1] + positions[:, 1]) * self.dims[2] + positions[:, 2]
+
+    def contains(self, positions):
+        keys = self.key(positions)
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[index] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+    def hidden(self, model_id):
+        # cull_faces() test for the faces of a model. A mesh is shared by every instance of its
+        # model, so faces are only hidden when they're covered in all of them. None when no face
+        # can be hidden.
+        if model_id in self.isolated or model_id not in self.instances or len(self.keys) == 0:
+            return None
+
+        def hidden(axis, sign, cells):
+            neighbors = cells.astype(np.int64)
+            neighbors[:, axis] += sign
+
+            covered = np.ones(len(cells), dtype=bool)
+            for rotation, shift in self.instances[model_id]:
+                covered &= self.contains(neighbors @ rotation.T + shift)
+            return covered
+
+        return hidden
+
+def model_digest(model, mesh_data):
+    # Hash of a model's voxels and mesh. Models with equal digests can share their objects.
+    digest = hashlib.sha1(np.array(model.size, dtype=np.int64).tobytes())
+    for array in (model.voxels, mesh_data.vertices, mesh_data.faces, mesh_data.colors):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def voxel_hash(model):
+    # Hash of a model's size and XYZI voxels, used to find the models that changed when a file
+    # is imported again.
+    digest = hashlib.sha1(np.array(model.size, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(model.voxels).tobytes())
+    return digest.hexdigest()
+
+def downsample(grid, factor, slab=16):
+    # Grid factor times smaller along every axis. Each cell takes the most common value of its
+    # factor^3 block, with empty counting as a value and ties going to the color. Blocks are
+    # voted on slab cells along x at a time to bound the temporary memory.
+    size = -(-np.array(grid.shape) // factor) # Rounded up.
+    padded = np.zeros(size * factor, dtype=np.uint8)
+    padded[:grid.shape[0], :grid.shape[1], :grid.shape[2]] = grid
+
+    out = np.empty(size, dtype=np.uint8)
+    block_size = factor**3
+    position = np.arange(block_size, dtype=np.int16)
+
+    for x in range(0, size[0], slab):
+        part = padded[x*factor:(x+slab)*factor]
+        count = part.shape[0] // factor
+
+        # One row per block, sorted so equal values form runs.
+        blocks = part.reshape(count, factor, size[1], factor, size[2], factor).transpose(0, 2, 4, 1, 3, 5).reshape(-1, block_size)
+        blocks = np.sort(blocks, axis=1)
+
+        # Length of the run up to every element, the longest run is the most common value.
+        starts = np.ones(blocks.shape, dtype=bool)
+        starts[:, 1:] = blocks[:, 1:] != blocks[:, :-1]
+        run_start = np.maximum.accumulate(np.where(starts, position, 0), axis=1)
+        score = (position - run_start + 1) * 2 + (blocks != 0)
+
+        best = np.argmax(score, axis=1)
+        out[x:x+count] = blocks[np.arange(len(blocks)), best].reshape(count, size[1], size[2])
 
-                for key in mat_dict:
-                    value = mat_dict[key]
+    return out
 
-                    mat = materials[id-1]
+def mesh_lod(model, factor, options, skip=None):
+    # MeshData of a model downsampled by factor, in the same units as the full model.
+    mesh_data = mesh_model(model, options, downsample(model.grid, factor), skip=skip)
+    return MeshData(mesh_data.vertices * factor, mesh_data.faces, mesh_data.colors, mesh_data.voxel_faces)
 
-                    if key == b'_type':
-                        type = value
+################################################################################################################################################
+## Volumes
+
+def volume_grids(model, densities, palette):
+    # Dense (X, Y, Z) density and (X, Y, Z, 3) linear color arrays of the voxels of a model
+    # with a volume density. None when there are none.
+    coords, colors = model.voxels[:, :3], model.voxels[:, 3]
+    keep = densities[colors] > 0
+    if not keep.any():
+        return None
+
+    coords, colors = coords[keep], colors[keep]
+    cells = (coords[:, 0], coords[:, 1], coords[:, 2])
+
+    density = np.zeros(model.size, dtype=np.float32)
+    density[cells] = densities[colors]
+
+    color = np.zeros(tuple(model.size) + (3,), dtype=np.float32)
+    color[cells] = (np.asarray(palette, dtype=np.float32)[colors.astype(np.int64) - 1, :3] / 255) ** 2.2 # sRGB to linear.
+
+    return density, color
+
+def write_volume(directory, model, densities, palette):
+    # Writes the glass and media voxels of a model to an OpenVDB file with "density" and
+    # "color" grids, placed like the model's mesh. Files are named after their content, so
+    # models that were written before are reused. Returns the path and the number of voxels,
+    # or None when the model has no such voxels.
+    grids = volume_grids(model, densities, palette)
+    if grids is None:
+        return None
+
+    density, color = grids
+    digest = hashlib.sha1(np.array(model.size, dtype=np.int64).tobytes())
+    digest.update(density.tobytes())
+    digest.update(color.tobytes())
+    path = os.path.join(directory, digest.hexdigest() + ".vdb")
+    count = int(np.count_nonzero(density))
+
+    if os.path.exists(path):
+        return path, count
+
+    # Voxel centers in the space of the mesh, see VoxelObject. OpenVDB matrices are row major
+    # with the translation in the last row.
+    offset = (0.5 - np.array(model.size) // 2).tolist()
+    transform = openvdb.createLinearTransform([[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], offset + [1]])
+
+    density_grid = openvdb.FloatGrid()
+    density_grid.copyFromArray(density)
+    color_grid = openvdb.Vec3SGrid()
+    color_grid.copyFromArray(color)
+    for name, grid in (("density", density_grid), ("color", color_grid)):
+        grid.name = name
+        grid.transform = transform
+
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".%d.tmp" % os.getpid()
+    openvdb.write(temp_path, grids=[density_grid, color_grid])
+    os.replace(temp_path, path)
+
+    return path, count
 
-                    if key == b'_rough':
-                        materials[id-1][0] = float(value) # Roughness
-                    elif key == b'_metal' and type == b'_metal':
-                        materials[id-1][1] = float(value) # Metalic
-                    elif key == b'_alpha' and type == b'_glass':
-                        materials[id-1][2] = float(value) # Glass
-                    elif key == b'_emit' and type == b'_emit':
-                        materials[id-1][3] = float(value) # Emission
-                    elif key == b'_flux':
-                        materials[id-1][3] *= float(value)+1 # Emission Power
+################################################################################################################################################
+## Lights
+
+def cluster_lights(voxels, emission, cell_size):
+    # Groups the emissive voxels of each color into cubes of cell_size voxels. emission is the
+    # emission strength of every color id. Returns the color id, center and voxel count of
+    # every cluster.
+    emissive = voxels[emission[voxels[:, 3]] > 0]
+    if len(emissive) == 0:
+        return np.zeros(0, dtype=np.uint8), np.zeros((0, 3)), np.zeros(0, dtype=np.int64)
+
+    cells = emissive.astype(np.int64) // cell_size
+    keys = ((emissive[:, 3].astype(np.int64) * 256 + cells[:, 0]) * 256 + cells[:, 1]) * 256 + cells[:, 2]
+    keys, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    centers = np.stack([np.bincount(inverse, emissive[:, axis] + 0.5, len(keys)) for axis in range(3)], axis=1)
+    return emissive[first, 3], centers / counts[:, np.newaxis], counts
+
+def plan_lights(voxels, uses, emission, cell_size, max_lights=0):
+    # Clusters the lights of every model so that the lights of all instances together stay under
+    # max_lights. voxels and uses are the voxel array and number of instances of every model.
+    # Clusters are doubled in size until the lights fit, and if even one light per color and
+    # model is too many only the largest clusters are kept.
+    # Returns [(colors, centers, counts)] for every model.
+    while True:
+        plan = [cluster_lights(model_voxels, emission, cell_size) for model_voxels in voxels]
+        total = sum(len(colors) * count for (colors, _, _), count in zip(plan, uses))
+
+        if max_lights <= 0 or total <= max_lights:
+            return plan
+        if cell_size >= 256:
+            break
+        cell_size = min(cell_size*2, 256)
+
+    clusters = [(-count, mod_id, i) for mod_id, (_, _, counts) in enumerate(plan) for i, count in enumerate(counts.tolist())]
+    keep = [[] for _ in plan]
+    total = 0
+    for _, mod_id, i in sorted(clusters):
+        if total + uses[mod_id] <= max_lights:
+            keep[mod_id].append(i)
+            total += uses[mod_id]
+
+    return [(colors[keep[mod_id]], centers[keep[mod_id]], counts[keep[mod_id]])
+            for mod_id, (colors, centers, counts) in enumerate(plan)]
 
+################################################################################################################################################
+## Cache
+
+class MeshCache:
+    # On-disk cache of prepare_file() results, keyed by the file's content and the options that
+    # change the generated geometry. Each entry is one .npz file. When the directory grows past
+    # max_size bytes the least recently used entries are removed.
+    VERSION = 3  # Bump when the meshing output or the entry layout changes.
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, path, options):
+        # Hash of the file's content, read in blocks, and the options.
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                digest.update(block)
+        digest.update(("%d %s" % (self.VERSION, options.key())).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def load(self, key, name):
+        path = self.path(key)
+
+        try:
+            with np.load(path) as entry:
+                result = self.unpack(entry, name)
+            os.utime(path) # Mark as recently used.
+        except FileNotFoundError: # Missing or evicted by another process.
+            return None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile): # Incomplete or corrupt.
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        return result
+
+    def store(self, key, vox, meshes):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first so other processes never see half written entries.
+        temp_path = self.path(key) + ".%d.tmp" % os.getpid()
+        with open(temp_path, 'wb') as file:
+            np.savez(file, **self.pack(vox, meshes))
+        os.replace(temp_path, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries): # Oldest first.
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    @staticmethod
+    def pack(vox, meshes):
+        # Flattens a VoxFile and its meshes into arrays for np.savez.
+        document = {
+            "materials": vox.materials,
+            "transforms": [[n.id, n.attributes, n.child_id, n.layer_id, n.frames] for n in vox.transforms.values()],
+            "groups": [[n.id, n.attributes, n.children] for n in vox.groups.values()],
+            "shapes": [[n.id, n.attributes, n.models] for n in vox.shapes.values()],
+            "layers": [[n.id, n.attributes] for n in vox.layers.values()],
+            "render_objects": vox.render_objects,
+            "cameras": vox.cameras,
+            "notes": vox.notes,
+        }
+
+        arrays = {
+            "document": np.array(json.dumps(document)),
+            "model_sizes": np.array([model.size for model in vox.models], dtype=np.int32).reshape(-1, 3),
+            "voxel_counts": np.array([len(model.voxels) for model in vox.models], dtype=np.int64),
+            "voxels": np.concatenate([model.voxels for model in vox.models] + [np.zeros((0, 4), dtype=np.uint8)]),
+            "vertex_counts": np.array([len(mesh.vertices) for mesh in meshes], dtype=np.int64),
+            "face_counts": np.array([len(mesh.faces) for mesh in meshes], dtype=np.int64),
+            "color_counts": np.array([len(mesh.colors) for mesh in meshes], dtype=np.int64),
+            "vertices": np.concatenate([mesh.vertices for mesh in meshes] + [np.zeros((0, 3), dtype=np.int32)]),
+            "faces": np.concatenate([mesh.faces for mesh in meshes] + [np.zeros((0, 4), dtype=np.int32)]),
+            "colors": np.concatenate([mesh.colors for mesh in meshes] + [np.zeros(0, dtype=np.uint8)]),
+            "voxel_faces": np.array([mesh.voxel_faces for mesh in meshes], dtype=np.int64),
+        }
+        if vox.palette is not None:
+            arrays["palette"] = vox.palette
+        if vox.index_map is not None:
+            arrays["index_map"] = vox.index_map
+
+        return arrays
+
+    @staticmethod
+    def unpack(entry, name):
+        vox = VoxFile(name)
+        document = json.loads(str(entry["document"]))
+
+        if "palette" in entry:
+            vox.palette = entry["palette"]
+        if "index_map" in entry:
+            vox.index_map = entry["index_map"]
+        vox.materials = {int(id): properties for id, properties in document["materials"].items()}
+        vox.render_objects = document["render_objects"]
+        vox.cameras = {int(id): properties for id, properties in document["cameras"].items()}
+        vox.notes = document["notes"]
+
+        for id, attributes, child_id, layer_id, frames in document["transforms"]:
+            vox.transforms[id] = TransformNode(id, attributes, child_id, layer_id, frames)
+        for id, attributes in document["layers"]:
+            vox.layers[id] = Layer(id, attributes)
+        for id, attributes, children in document["groups"]:
+            vox.groups[id] = GroupNode(id, attributes, children)
+        for id, attributes, models in document["shapes"]:
+            vox.shapes[id] = ShapeNode(id, attributes, [tuple(model) for model in models])
+
+        voxels = np.split(entry["voxels"], np.cumsum(entry["voxel_counts"])[:-1])
+        for size, model_voxels in zip(entry["model_sizes"].tolist(), voxels):
+            vox.models.append(VoxModel(tuple(size), model_voxels))
+
+        meshes = []
+        vertices = np.split(entry["vertices"], np.cumsum(entry["vertex_counts"])[:-1])
+        faces = np.split(entry["faces"], np.cumsum(entry["face_counts"])[:-1])
+        colors = np.split(entry["colors"], np.cumsum(entry["color_counts"])[:-1]) # One per vertex for points.
+        for mesh in zip(vertices, faces, colors, entry["voxel_faces"].tolist()):
+            meshes.append(MeshData(*mesh))
+
+        return vox, meshes
 
+################################################################################################################################################
+## Profiling
+
+# Functions called with the trace of every imported file, see Profiler.trace(). Lets scripts
+# collect import timings without going through the operator.
+profile_handlers = []
+
+class Profiler:
+    # Wall time, and with trace_memory the tracemalloc peak, of each stage of importing a file.
+    # Stages that run more than once, like the ones for every model, are added up.
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.stages = {}  # {stage name : [seconds, calls, peak bytes]}
+
+    def start(self, name):
+        # Starts timing a stage, returns what stop() needs to end it. Stages shouldn't be nested,
+        # each one resets the tracemalloc peak.
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        return name, time.perf_counter()
+
+    def stop(self, stage):
+        name, start = stage
+        self.add(name, time.perf_counter() - start, tracemalloc.get_traced_memory()[1] if self.trace_memory else 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stage = self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(stage)
+
+    def add(self, name, seconds, peak=0, calls=1):
+        record = self.stages.setdefault(name, [0.0, 0, 0])
+        record[0] += seconds
+        record[1] += calls
+        record[2] = max(record[2], peak)
+
+    def merge(self, other):
+        # Adds the stages recorded by another profiler, like the copy sent to a worker process.
+        for name, (seconds, calls, peak) in other.stages.items():
+            self.add(name, seconds, peak, calls)
+
+    def total(self):
+        return sum(seconds for seconds, _, _ in self.stages.values())
+
+    def trace(self):
+        # JSON compatible summary of the recorded stages.
+        stages = {}
+        for name, (seconds, calls, peak) in self.stages.items():
+            stages[name] = {"seconds": seconds, "calls": calls}
+            if self.trace_memory:
+                stages[name]["peak_bytes"] = peak
+
+        return {"file": self.name, "seconds": self.total(), "stages": stages}
+
+    def finish(self):
+        # Passes the trace to the profile_handlers and returns it.
+        trace = self.trace()
+        for handler in profile_handlers:
+            handler(trace)
+        return trace
 
-    ### Import Options ###
+################################################################################################################################################
+## Import Preparation
+
+class MeshOptions:
+    # Importer options that change the generated geometry. Sent to worker processes and part of
+    # cache keys.
+    def __init__(self, greedy=False, weld=False, brick_size=0, lods=(), scene_culling=False, points=False, volumes=False):
+        self.greedy = greedy
+        self.weld = weld
+        self.brick_size = brick_size  # 0 meshes whole models at once.
+        self.lods = tuple(lods)  # Downsampling factors of the LOD meshes.
+        self.scene_culling = scene_culling  # Remove faces covered by other models, see SceneOcclusion.
+        self.points = points  # A vertex per voxel instead of faces, see mesh_points().
+        self.volumes = volumes  # Leave out glass and media voxels, they're imported as volumes.
+
+    def key(self):
+        return "%d %d %d %s %d %d %d" % (self.greedy, self.weld, self.brick_size, ",".join(map(str, self.lods)), self.scene_culling,
+                                         self.points, self.volumes)
+
+def mesh_vox(vox, options):
+    # MeshData of every model in the file, indexed by model id. The LOD meshes of every model
+    # follow, one more list of len(vox.models) for each factor in options.lods. Models that
+    # are only used on hidden layers get empty meshes.
+    skip = vox.volume_densities() > 0 if options.volumes else None
+    instances = vox.instances()
+    visible = used_models(instances)
+
+    occlusion = None
+    if options.scene_culling and not options.points:
+        occlusion = SceneOcclusion(vox.models, instances, skip)
+
+    meshes = []
+    for id, model in enumerate(vox.models):
+        if id not in visible:
+            meshes.append(MeshData.empty())
+        else:
+            meshes.append(mesh_model(model, options, hidden=occlusion.hidden(id) if occlusion else None, skip=skip))
+    for factor in options.lods:
+        meshes += [mesh_lod(model, factor, options, skip) if id in visible else MeshData.empty() for id, model in enumerate(vox.models)]
+    return meshes
+
+def prepare_file(path, options, cache=None, profiler=None):
+    # Everything about importing a file that doesn't need Blender. Runs in worker processes.
+    # With a MeshCache, files that were prepared before with the same options are loaded from it.
+    if profiler is None:
+        profiler = Profiler(path)
+
+    name = os.path.basename(path).replace('.vox', '')
+
+    if cache is not None:
+        with profiler.stage("read"):
+            key = cache.key(path, options)
+
+        with profiler.stage("cache load"):
+            result = cache.load(key, name)
+        if result is not None:
+            result[0].path = path
+            return result
+
+    with profiler.stage("parse"): # Reads the chunks it needs from the file, see VoxFile.load().
+        vox = VoxFile.load(path)
+
+    with profiler.stage("mesh"):
+        meshes = mesh_vox(vox, options)
+
+    if cache is not None:
+        with profiler.stage("cache store"):
+            cache.store(key, vox, meshes)
+
+    return vox, meshes
+
+def prepare_file_profiled(path, options, cache, profiler):
+    # prepare_file() for worker processes, which have to send their copy of the profiler back.
+    return prepare_file(path, options, cache, profiler), profiler
+
+def prepare_files(paths, options, workers=1, cache=None, profilers=None):
+    # Yields prepare_file() results in the order of paths. With more than one worker the files
+    # are parsed and meshed in a process pool while earlier results are being consumed.
+    # profilers has one Profiler for every path.
+    if profilers is None:
+        profilers = [Profiler(path) for path in paths]
+
+    if workers <= 1 or len(paths) <= 1:
+        for path, profiler in zip(paths, profilers):
+            yield prepare_file(path, options, cache, profiler)
+        return
+
+    # Forking a running Blender isn't safe, always start fresh interpreters.
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(paths)), mp_context=context) as executor:
+        results = executor.map(prepare_file_profiled, paths, [options]*len(paths), [cache]*len(paths), profilers)
+        for profiler, (result, worker_profiler) in zip(profilers, results):
+            profiler.merge(worker_profiler)
+            yield result
 
+################################################################################################################################################
+## Blender Import
+
+def add_color_layer(mesh, name, colors):
+    # Byte color layer on face corners. colors is a (loops, 4) array of sRGB colors.
+    if hasattr(mesh, "vertex_colors"):
+        layer = mesh.vertex_colors.new(name=name)
+        layer.data.foreach_set("color", colors.ravel())
+    else: # Legacy vertex colors were removed, use the equivalent color attribute.
+        layer = mesh.color_attributes.new(name, 'BYTE_COLOR', 'CORNER')
+        layer.data.foreach_set("color_srgb", colors.ravel())
+
+def create_mesh(name, mesh_data, material_type, palette, materials):
+    # Builds a mesh straight from MeshData arrays with foreach_set, including the per-corner
+    # color data of the VertCol and Tex palette import methods.
+    mesh = bpy.data.meshes.new(name)
+
+    num_faces = len(mesh_data.faces)
+    loop_colors = np.repeat(mesh_data.colors.astype(np.int64), 4) # Color id of every face corner.
+
+    mesh.vertices.add(len(mesh_data.vertices))
+    mesh.vertices.foreach_set("co", mesh_data.vertices.astype(np.float32).ravel())
+
+    mesh.loops.add(num_faces * 4)
+    mesh.loops.foreach_set("vertex_index", mesh_data.faces.astype(np.int32).ravel())
+
+    mesh.polygons.add(num_faces)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, num_faces*4, 4, dtype=np.int32))
+    if not bpy.types.MeshPolygon.bl_rna.properties["loop_total"].is_readonly: # Derived from loop_start since Blender 4.0.
+        mesh.polygons.foreach_set("loop_total", np.full(num_faces, 4, dtype=np.int32))
+
+    if material_type == 'VertCol':
+        palette = np.asarray(palette, dtype=np.float32)
+        materials = np.array(materials, dtype=np.float32)
+        materials[:, 3] /= 5 # Map emit value from [0,5] to [0,1]
+
+        add_color_layer(mesh, "Col", palette[loop_colors-1])
+        add_color_layer(mesh, "Mat", materials[loop_colors-1])
+
+    elif material_type == 'Tex':
+        uvs = np.zeros((len(loop_colors), 2), dtype=np.float32)
+        uvs[:, 0] = (loop_colors-0.5)/256
+        uvs[:, 1] = 0.5
+
+        uv = mesh.uv_layers.new(name="UVMap")
+        uv.data.foreach_set("uv", uvs.ravel())
+
+    mesh.update(calc_edges=True)
+    return mesh
+
+def add_point_attribute(mesh, name, data_type, key, values):
+    # Attribute on the vertices of mesh, set from an array with one row per vertex.
+    attribute = mesh.attributes.new(name, data_type, 'POINT')
+    attribute.data.foreach_set(key, np.ascontiguousarray(values).ravel())
+
+def create_point_mesh(name, mesh_data, material_type, palette, materials):
+    # Vertex only mesh for the Points meshing mode. The color id of every voxel goes into the
+    # "vox_color" attribute and the VertCol colors onto the points, the modifier made by
+    # cube_node_group() passes them on to the cubes.
+    mesh = bpy.data.meshes.new(name)
+    colors = mesh_data.colors.astype(np.int64)
+
+    mesh.vertices.add(len(mesh_data.vertices))
+    mesh.vertices.foreach_set("co", mesh_data.vertices.astype(np.float32).ravel())
+
+    add_point_attribute(mesh, "vox_color", 'INT', "value", colors.astype(np.int32))
+
+    if material_type == 'VertCol':
+        palette = np.asarray(palette, dtype=np.float32)
+        materials = np.array(materials, dtype=np.float32)
+        materials[:, 3] /= 5 # Map emit value from [0,5] to [0,1]
+
+        add_point_attribute(mesh, "Col", 'BYTE_COLOR', "color_srgb", palette[colors-1])
+        add_point_attribute(mesh, "Mat", 'BYTE_COLOR', "color_srgb", materials[colors-1])
+
+    mesh.update()
+    return mesh
+
+def add_group_socket(group, name, in_out, socket_type):
+    if hasattr(group, "interface"): # Node group sockets moved to the interface in Blender 4.0.
+        return group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+    return (group.inputs if in_out == 'INPUT' else group.outputs).new(socket_type, name)
+
+def enabled_socket(sockets, name):
+    # Nodes with a data type have a socket of every type under the same name, only the one of
+    # the current type is enabled.
+    return next(socket for socket in sockets if socket.name == name and socket.enabled)
+
+def named_attribute_node(nodes, name, data_type):
+    node = nodes.new('GeometryNodeInputNamedAttribute')
+    node.data_type = data_type
+    node.inputs["Name"].default_value = name
+    return enabled_socket(node.outputs, "Attribute")
+
+def cube_node_group(material_type):
+    # Geometry Nodes group turning the points of create_point_mesh() into cubes, shared by
+    # every import with the same palette import method. The instances are realized so the
+    # attributes of the points carry over to the faces, where they set the material slots or
+    # the texture coordinates.
+    name = "Vox Cubes " + material_type
+    group = bpy.data.node_groups.get(name)
+    if group is not None:
+        return group
+
+    group = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    add_group_socket(group, "Geometry", 'INPUT', 'NodeSocketGeometry')
+    add_group_socket(group, "Voxel Size", 'INPUT', 'NodeSocketFloat').default_value = 1
+    add_group_socket(group, "Geometry", 'OUTPUT', 'NodeSocketGeometry')
+
+    nodes, links = group.nodes, group.links
+    group_input = nodes.new('NodeGroupInput')
+    group_output = nodes.new('NodeGroupOutput')
+
+    cube = nodes.new('GeometryNodeMeshCube')
+    links.new(group_input.outputs["Voxel Size"], cube.inputs["Size"])
+
+    instances = nodes.new('GeometryNodeInstanceOnPoints')
+    links.new(group_input.outputs["Geometry"], instances.inputs["Points"])
+    links.new(cube.outputs["Mesh"], instances.inputs["Instance"])
+
+    realize = nodes.new('GeometryNodeRealizeInstances')
+    links.new(instances.outputs["Instances"], realize.inputs["Geometry"])
+    geometry = realize.outputs["Geometry"]
+
+    if material_type == 'SepMat':
+        set_index = nodes.new('GeometryNodeSetMaterialIndex')
+        links.new(geometry, set_index.inputs["Geometry"])
+        links.new(named_attribute_node(nodes, "vox_material_index", 'INT'), set_index.inputs["Material Index"])
+        geometry = set_index.outputs["Geometry"]
+
+    elif material_type == 'Tex': # Same UVs as create_mesh(), (color id - 0.5) / 256 along the palette texture.
+        u = nodes.new('ShaderNodeMath')
+        u.operation = 'MULTIPLY_ADD'
+        u.inputs[1].default_value = 1/256
+        u.inputs[2].default_value = -0.5/256
+        links.new(named_attribute_node(nodes, "vox_color", 'INT'), u.inputs[0])
+
+        uv = nodes.new('ShaderNodeCombineXYZ')
+        uv.inputs["Y"].default_value = 0.5
+        links.new(u.outputs["Value"], uv.inputs["X"])
+
+        store = nodes.new('GeometryNodeStoreNamedAttribute')
+        store.data_type = 'FLOAT2'
+        store.domain = 'CORNER'
+        store.inputs["Name"].default_value = "UVMap"
+        links.new(geometry, store.inputs["Geometry"])
+        links.new(uv.outputs["Vector"], enabled_socket(store.inputs, "Value"))
+        geometry = store.outputs["Geometry"]
+
+    links.new(geometry, group_output.inputs["Geometry"])
+    return group
+
+def add_cube_modifier(obj, group, size):
+    # Geometry Nodes modifier of a point mesh, with cubes size voxels large.
+    modifier = obj.modifiers.new("Voxel Cubes", 'NODES')
+    modifier.node_group = group
+
+    if hasattr(group, "interface"):
+        identifier = next(item.identifier for item in group.interface.items_tree
+                          if item.item_type == 'SOCKET' and item.in_out == 'INPUT' and item.name == "Voxel Size")
+    else:
+        identifier = group.inputs["Voxel Size"].identifier
+    modifier[identifier] = float(size)
+
+
+def mesh_options(options):
+    # MeshOptions from the ImportVox properties.
+    return MeshOptions(options.meshing == 'Greedy', options.cleanup_mesh, options.brick_size, lod_factors(options),
+                       options.scene_culling, options.meshing == 'Points', use_volumes(options))
+
+def use_volumes(options):
+    # Whether glass and media voxels are imported as volumes, which needs OpenVDB.
+    return options.create_volume and openvdb is not None
+
+def volume_directory():
+    # Where the .vdb files of volumes are written, next to the blend file once it's saved.
+    if bpy.data.filepath:
+        return bpy.path.abspath("//vox_volumes")
+    return os.path.join(tempfile.gettempdir(), "magicavoxel_importer", "volumes")
+
+def create_volume_material(name):
+    # Principled Volume shader reading the grids written by write_volume().
+    mat = bpy.data.materials.new(name = name + " Volume")
+    mat.use_nodes = True
+
+    nodes = mat.node_tree.nodes
+    nodes.clear()
+    output = nodes.new("ShaderNodeOutputMaterial")
+    volume = nodes.new("ShaderNodeVolumePrincipled")
+    volume.inputs["Color Attribute"].default_value = "color"
+    volume.inputs["Density Attribute"].default_value = "density"
+    mat.node_tree.links.new(volume.outputs["Volume"], output.inputs["Volume"])
+
+    return mat
+
+def instance_matrix(translation, rotation, vox_size):
+    # World matrix of an object placing a model like a SceneInstance, scaled to vox_size.
+    return Matrix.Translation(Vector(translation) * vox_size) @ Matrix(rotation).to_4x4() @ Matrix.Scale(vox_size, 4)
+
+def lod_factors(options):
+    return sorted(int(factor) for factor in options.lods)
+
+def emission_strengths(materials):
+    # Emission strength of every color id, from material_properties().
+    emission = np.zeros(256)
+    emission[1:] = [mat[3] for mat in materials]
+    return emission
+
+# ImportVox properties that proxies need to be realized the same way as a normal import.
+PROXY_SETTINGS = ("voxel_size", "material_type", "gamma_correct", "gamma_value", "meshing", "brick_size", "cleanup_mesh", "create_volume",
+                  "lods", "scene_culling", "create_lights", "light_cluster_size", "max_lights")
+
+def proxy_settings(options):
+    settings = {name: getattr(options, name) for name in PROXY_SETTINGS}
+    settings["lods"] = sorted(settings["lods"]) # Sets can't be stored as JSON.
+    return settings
+
+def add_proxy(vox, instance, settings, collection):
+    # Empty drawn as the bounding box of an instance. What realize_proxies() needs to replace it
+    # with a mesh is stored in custom properties.
+    model = vox.models[instance.model_id]
+    vox_size = settings["voxel_size"]
+    size = np.array(model.size)
+    center = size / 2 - size // 2 # Relative to the model origin, see VoxelObject.
+
+    obj = bpy.data.objects.new(vox.name, None)
+    obj.empty_display_type = 'CUBE'
+    obj.matrix_world = (instance_matrix(instance.translation, instance.rotation, vox_size)
+                        @ Matrix.Translation(Vector(center.tolist())) @ Matrix.Diagonal(Vector((size / 2).tolist() + [1])))
+
+    obj["vox_path"] = vox.path
+    obj["vox_model"] = instance.model_id
+    obj["vox_translation"] = list(instance.translation)
+    obj["vox_rotation"] = [value for row in instance.rotation for value in row]
+    obj["vox_settings"] = json.dumps(settings)
+
+    if collection == None:
+        bpy.context.scene.collection.objects.link(obj)
+    else:
+        collection.objects.link(obj)
+
+    return obj
+
+def create_lod_collections(file_name, factors, parent):
+    # A collection in parent for every LOD factor, hidden until it's needed. Returns
+    # {factor : collection}.
+    lod_cols = {}
+    for factor in factors:
+        lod_col = bpy.data.collections.new(file_name + " LOD " + str(factor))
+        parent.children.link(lod_col)
+        lod_col.hide_viewport = True
+        lod_col.hide_render = True
+        lod_cols[factor] = lod_col
+    return lod_cols
+
+def realize_proxies(proxies):
+    # Replaces proxies made by add_proxy() with meshed objects in the same collection. Returns
+    # the number of realized proxies.
+    return sum(realize_steps(proxy_groups(proxies)))
+
+def proxy_groups(proxies):
+    # {(path, model id, settings) : [proxy name]}, the proxies that can share one mesh.
+    groups = {}
+    for proxy in proxies:
+        groups.setdefault((proxy["vox_path"], proxy["vox_model"], proxy["vox_settings"]), []).append(proxy.name)
+    return groups
+
+def realize_steps(groups):
+    # Generator doing the work of realize_proxies() for proxy_groups(), yielding once for every
+    # realized proxy so it can be spread over timer calls. LOD meshes and scene culling follow
+    # the import settings stored in the proxies. Everything loaded or meshed is kept until the
+    # last proxy, however many steps that takes.
+    files = {}  # {path : VoxFile}
+    for path, model_id, _ in groups:
+        if path not in files:
+            files[path] = VoxFile.load(path, voxels=False)
+        files[path].models[model_id].load_voxels(path)
+
+    # Lights are planned for all proxies of a file together, so max_lights holds for the file
+    # like it does on import.
+    light_groups = {}  # {(path, settings) : [(model id, number of proxies)]}
+    for (path, model_id, settings_json), names in groups.items():
+        light_groups.setdefault((path, settings_json), []).append((model_id, len(names)))
+
+    light_plans = {}  # {(path, model id, settings) : (colors, centers, counts)}
+    for (path, settings_json), uses in light_groups.items():
+        settings = json.loads(settings_json)
+        if not settings["create_lights"]:
+            continue
+
+        vox = files[path]
+        plan = plan_lights([vox.models[model_id].voxels for model_id, _ in uses], [count for _, count in uses],
+                           emission_strengths(vox.material_properties()), settings["light_cluster_size"], settings["max_lights"])
+        for (model_id, _), model_plan in zip(uses, plan):
+            light_plans[path, model_id, settings_json] = model_plan
+
+    volume_materials = {}  # {path : material}
+    occlusions = {}  # {(path, settings) : SceneOcclusion}
+    lod_cols = {}  # {(path, settings) : {factor : collection}}
+    for (path, model_id, settings_json), names in groups.items():
+        settings = types.SimpleNamespace(**json.loads(settings_json))
+
+        vox = files[path]
+        model = vox.models[model_id]
+
+        palette = (vox.palette[:255] / 255).tolist()
+        materials = vox.material_properties()
+        obj = VoxelObject(model)
+
+        if settings.create_lights:
+            obj.light_colors, obj.light_centers, obj.light_counts = light_plans[path, model_id, settings_json]
+
+        material_name = None
+        if settings.material_type != 'None':
+            material_name = find_palette_materials(palette_digest(vox, settings), settings.material_type)
+
+        options = mesh_options(settings)
+        densities = vox.volume_densities()
+        skip = densities > 0 if options.volumes else None
+
+        # Culling needs the voxels of every model in the scene, not just the realized ones.
+        hidden = None
+        if options.scene_culling and not options.points:
+            if (path, settings_json) not in occlusions:
+                for other in vox.models:
+                    other.load_voxels(path)
+                occlusions[path, settings_json] = SceneOcclusion(vox.models, vox.instances(), skip)
+            hidden = occlusions[path, settings_json].hidden(model_id)
+
+        profiler = Profiler(path)
+        obj.generate(vox.name, mesh_model(model, options, hidden=hidden, skip=skip), settings.voxel_size, settings.material_type,
+                     palette, materials, profiler, material_name)
+        for factor in options.lods:
+            obj.generate_lod(vox.name, factor, mesh_lod(model, factor, options, skip), settings.material_type,
+                             palette, materials, profiler, material_name)
+
+        digest = palette_digest(vox, settings)
+        hash = mesh_hash(model, settings, digest, densities)
+        for factor, mesh in [(0, obj.mesh)] + list(obj.lod_meshes.items()):
+            if mesh is not None:
+                tag_mesh(mesh, path, model_id, factor, settings_json, hash, digest)
+
+        # Shared with earlier realizes of the same file.
+        if (path, settings_json) not in lod_cols:
+            cols = {factor: bpy.data.collections.get(vox.name + " LOD " + str(factor)) for factor in options.lods}
+            missing = [factor for factor, col in cols.items() if col is None]
+            cols.update(create_lod_collections(vox.name, missing, bpy.context.scene.collection))
+            lod_cols[path, settings_json] = cols
+
+        if options.volumes and skip.any():
+            if path not in volume_materials:
+                volume_materials[path] = create_volume_material(vox.name)
+            obj.generate_volume(vox.name, volume_directory(), densities, vox.palette, volume_materials[path], profiler)
+
+        for name in names:
+            proxy = bpy.data.objects.get(name)
+            if proxy is None or "vox_path" not in proxy: # Deleted or realized since it was queued.
+                continue
+
+            collection = proxy.users_collection[0]
+            light_col = collection if settings.create_lights else None
+            values = list(proxy.get("vox_rotation", [value for row in IDENTITY for value in row]))
+            rotation = (values[0:3], values[3:6], values[6:9])
+            matrix = instance_matrix(tuple(proxy["vox_translation"]), rotation, settings.voxel_size)
+            instance_obj = obj.add_instance(vox.name, matrix, (collection, light_col, None))
+            if instance_obj is not None:
+                instance_obj["vox_model"] = model_id
+            for lod_obj in obj.add_lod_instances(vox.name, matrix, lod_cols[path, settings_json]):
+                lod_obj["vox_model"] = model_id
+            bpy.data.objects.remove(proxy)
+            yield 1
+
+def mesh_hash(model, settings, digest, densities):
+    # Hash of everything that goes into the mesh of a model: its voxels, the meshing options,
+    # for VertCol the palette, which is stored in the mesh, and with volumes the colors left out
+    # of the mesh. densities is the volume_densities() of the file.
+    options = mesh_options(settings)
+    hash = hashlib.sha1(voxel_hash(model).encode())
+    hash.update(options.key().encode())
+    if settings.material_type == 'VertCol':
+        hash.update(digest.encode())
+    if options.volumes:
+        hash.update((densities > 0).tobytes())
+    return hash.hexdigest()
+
+def tag_mesh(mesh, path, model_id, factor, settings, hash, digest):
+    # Custom properties recording where a mesh came from, for sync_file(). factor is the LOD
+    # factor, 0 for the full mesh. settings is the JSON of proxy_settings(), hash the
+    # mesh_hash() and digest the palette_digest() of the file.
+    mesh["vox_path"] = path
+    mesh["vox_model"] = model_id
+    mesh["vox_lod"] = factor
+    mesh["vox_settings"] = settings
+    mesh["vox_hash"] = hash
+    mesh["vox_palette"] = digest
+
+def material_names(file_name, options):
+    # Names of the materials create_materials() makes for file_name.
+    if options.material_type == 'SepMat':
+        return [file_name + " #" + str(id+1) for id in range(255)]
+    return [file_name]
+
+def update_materials(file_name, options, palette, materials, digest, meshes):
+    # Brings the materials of a file up to date with its changed palette. Materials created
+    # under file_name and only used by meshes are updated in place, only the colors that
+    # changed. When they're missing or also used by other meshes, new materials are created
+    # under a free name. Returns that name and the number of materials changed.
+    names = material_names(file_name, options)
+    own = [bpy.data.materials.get(name) for name in names]
+
+    shared = any(mat is None or mat.get("vox_name") != file_name for mat in own)
+    if not shared:
+        own_names = set(names)
+        for mesh in bpy.data.meshes:
+            if mesh not in meshes and any(mat is not None and mat.name in own_names for mat in mesh.materials):
+                shared = True
+                break
+
+    if shared:
+        # A name none of the new materials or images exist under, so no others are replaced.
+        name, index = file_name, 0
+        while any(bpy.data.materials.get(mat_name) is not None for mat_name in material_names(name, options)) \
+                or (options.material_type == 'Tex' and (name + '_col' in bpy.data.images or name + '_mat' in bpy.data.images)):
+            index += 1
+            name = "%s.%03d" % (file_name, index)
+        # The stored settings don't include override_materials.
+        create_options = types.SimpleNamespace(**{**vars(options), "override_materials": False})
+        create_materials(name, create_options, palette, materials, digest)
+        palette_registry[digest] = name
+        return name, len(names)
+
+    changed = 0
+    if options.material_type == 'SepMat':
+        for mat, col, values in zip(own, gamma_colors(options, palette), materials):
+            if mat.get("vox_color") != json.dumps([col, values]):
+                set_color_material(mat, col, values)
+                changed += 1
+
+    elif options.material_type == 'Tex':
+        col_img, mat_img = bpy.data.images.get(file_name + '_col'), bpy.data.images.get(file_name + '_mat')
+        if col_img is not None and mat_img is not None:
+            fill_palette_images(col_img, mat_img, palette, materials)
+            changed = 1
+
+    for mat in own:
+        tag_material(mat, file_name, digest)
+    palette_registry[digest] = file_name
+    return file_name, changed
+
+def retarget_materials(mesh, material_name):
+    # Points the material slots of a mesh at the materials created under material_name.
+    for index, mat in enumerate(mesh.materials):
+        if mat is None or "vox_name" not in mat:
+            continue
+
+        suffix = mat.name[len(mat["vox_name"]):] # " #color id" for SepMat.
+        target = bpy.data.materials.get(material_name + suffix)
+        if target is not None and target != mat:
+            mesh.materials[index] = target
+
+def sync_file(path):
+    # Updates the meshes and materials imported from path, found by their custom properties,
+    # to the current content of the file. Returns the number of meshes updated, meshes checked
+    # and materials changed.
+    groups = {}  # {settings : [mesh]}, the file could have been imported with different settings.
+    for mesh in bpy.data.meshes:
+        if mesh.get("vox_path") == path:
+            groups.setdefault(mesh["vox_settings"], []).append(mesh)
+    if not groups:
+        return 0, 0, 0
+
+    vox = VoxFile.load(path)
+    totals = [0, 0, 0]
+    for settings, meshes in groups.items():
+        for i, count in enumerate(sync_meshes(vox, settings, meshes)):
+            totals[i] += count
+    return tuple(totals)
+
+def sync_meshes(vox, settings_json, meshes):
+    # sync_file() for the meshes imported with the settings in settings_json. Only meshes whose
+    # hash changed are generated again. The new mesh replaces the old one on the objects of the
+    # changed models, so they keep their transforms and modifiers.
+    settings = types.SimpleNamespace(**json.loads(settings_json))
+    options = mesh_options(settings)
+    palette = (vox.palette[:255] / 255).tolist()
+    materials = vox.material_properties()
+    digest = palette_digest(vox, settings)
+
+    # Materials, when the palette or material chunks changed.
+    material_name, changed_materials = None, 0
+    if settings.material_type != 'None':
+        material_name = find_palette_materials(digest, settings.material_type)
+        if material_name is None:
+            material_name, changed_materials = update_materials(vox.name, settings, palette, materials, digest, meshes)
+
+    densities = vox.volume_densities()
+    skip = densities > 0 if options.volumes else None
+    occlusion = None
+    if options.scene_culling and not options.points:
+        occlusion = SceneOcclusion(vox.models, vox.instances(), skip)
+
+    def generate(model_id, factor, name):
+        # New mesh of a model, tagged like the one it replaces.
+        model = vox.models[model_id]
+        obj = VoxelObject(model)
+        profiler = Profiler(vox.path)
+        if factor:
+            obj.generate_lod(vox.name, factor, mesh_lod(model, factor, options, skip), settings.material_type,
+                             palette, materials, profiler, material_name)
+            new_mesh = obj.lod_meshes.get(factor)
+        else:
+            hidden = occlusion.hidden(model_id) if occlusion else None
+            obj.generate(vox.name, mesh_model(model, options, hidden=hidden, skip=skip), settings.voxel_size,
+                         settings.material_type, palette, materials, profiler, material_name)
+            new_mesh = obj.mesh
+
+        if new_mesh is None: # Nothing left of the model.
+            new_mesh = bpy.data.meshes.new(name)
+        tag_mesh(new_mesh, vox.path, model_id, factor, settings_json, mesh_hash(model, settings, digest, densities), digest)
+        return new_mesh
+
+    users = mesh_users(vox.path)
+    updated = 0
+    for mesh in meshes:
+        # Models with the same voxels were given one mesh, but they could differ now. Group the
+        # models shown with this mesh by their current hash.
+        owner, factor = mesh["vox_model"], mesh["vox_lod"]
+        mesh_objects = [(obj, owner if model_id is None else model_id) for obj, model_id in users.get(mesh.name, ())]
+        groups = {}  # {hash : [model id]}
+        for model_id in sorted({owner} | {model_id for _, model_id in mesh_objects}):
+            if model_id < len(vox.models): # Models deleted from the file keep their mesh.
+                groups.setdefault(mesh_hash(vox.models[model_id], settings, digest, densities), []).append(model_id)
+
+        kept = groups.pop(mesh.get("vox_hash"), None)
+        if kept is not None and material_name is not None:
+            retarget_materials(mesh, material_name)
+        if not groups:
+            continue
+
+        if kept is None and len(groups) == 1 and owner < len(vox.models) \
+                and all(model_id < len(vox.models) for _, model_id in mesh_objects):
+            # Every model changed the same way. Replace the old mesh everywhere, under the same
+            # name so animation frame swaps still find it.
+            name = mesh.name
+            new_mesh = generate(owner, factor, name)
+            mesh.user_remap(new_mesh)
+            bpy.data.meshes.remove(mesh)
+            new_mesh.name = name
+            updated += 1
+            continue
+
+        # Only the objects of the changed models get a new mesh.
+        for group in groups.values():
+            new_mesh = generate(group[0], factor, mesh.name)
+            for obj, model_id in mesh_objects:
+                if model_id not in group:
+                    continue
+                if "vox_frames" in obj:
+                    frames = json.loads(obj["vox_frames"])
+                    for entry in frames:
+                        if entry[1] == mesh.name and (entry[2] if len(entry) > 2 else owner) in group:
+                            entry[1] = new_mesh.name
+                    obj["vox_frames"] = json.dumps(frames)
+                    show_frame_mesh(obj, bpy.context.scene.frame_current)
+                else:
+                    obj.data = new_mesh
+            updated += 1
+
+        if kept is None:
+            if all(model_id < len(vox.models) for _, model_id in mesh_objects):
+                bpy.data.meshes.remove(mesh) # Every object moved to a new mesh.
+        elif owner not in kept:
+            mesh["vox_model"] = kept[0]
+
+    return updated, len(meshes), changed_materials
+
+def mesh_users(path):
+    # {mesh name : [(object, model id)]} of the mesh objects showing meshes imported from path,
+    # including the meshes objects with a model per frame swap to. The model id is None for
+    # objects imported before it was stored on them.
+    users = {}
+    for obj in bpy.data.objects:
+        if obj.type != 'MESH':
+            continue
+
+        if "vox_frames" in obj:
+            for entry in json.loads(obj["vox_frames"]):
+                mesh = bpy.data.meshes.get(entry[1])
+                if mesh is not None and mesh.get("vox_path") == path:
+                    users.setdefault(entry[1], []).append((obj, entry[2] if len(entry) > 2 else None))
+        elif obj.data.get("vox_path") == path:
+            users.setdefault(obj.data.name, []).append((obj, obj.get("vox_model")))
+    return users
+
+proxy_jobs = []  # realize_steps() of the proxies being realized in the background.
+PROXIES_PER_STEP = 4
+
+def realize_queued_proxies():
+    # bpy.app.timers callback that realizes a few queued proxies every call until none are left.
+    for _ in range(PROXIES_PER_STEP):
+        if next(proxy_jobs[0], None) is None: # Job done.
+            proxy_jobs.pop(0)
+            if not proxy_jobs:
+                return None
+    return 0.1
+
+# Materials of earlier imports, so files with the same palette can share them.
+palette_registry = {}  # {palette digest : name the materials were created under}
+registry_files = set()  # .blend files whose materials were added to palette_registry.
+
+def palette_digest(vox, options):
+    # Hash of everything that goes into the materials of a file. Equal digests give identical
+    # materials.
+    gamma_value = options.gamma_value if options.gamma_correct and options.material_type == 'SepMat' else 1
+
+    digest = hashlib.sha1(np.ascontiguousarray(vox.palette).tobytes())
+    digest.update(json.dumps(vox.materials, sort_keys=True).encode())
+    digest.update(("%s %r" % (options.material_type, gamma_value)).encode())
+    return digest.hexdigest()
+
+def tag_material(mat, name, digest):
+    mat["vox_palette"] = digest
+    mat["vox_name"] = name
+
+def find_palette_materials(digest, material_type):
+    # Name the materials for a palette with this digest were created under, None if there
+    # aren't any.
+    if bpy.data.filepath not in registry_files: # Also look at materials saved in the .blend file.
+        registry_files.add(bpy.data.filepath)
+        for mat in bpy.data.materials:
+            if "vox_palette" in mat:
+                palette_registry.setdefault(mat["vox_palette"], mat["vox_name"])
+
+    name = palette_registry.get(digest)
+    if name is None:
+        return None
+
+    # The materials could have been deleted or replaced since.
+    mat = bpy.data.materials.get(name + " #1" if material_type == 'SepMat' else name)
+    if mat is None or mat.get("vox_palette") != digest:
+        del palette_registry[digest]
+        return None
+
+    return name
+
+def set_color_material(mat, col, values):
+    # Sets up the Principled BSDF of a SepMat material. values is [roughness, metallic, glass,
+    # emission], see VoxFile.material_properties().
+    mat.diffuse_color = col
+    mat["vox_color"] = json.dumps([col, values]) # Compared by update_materials().
+
+    bsdf = mat.node_tree.nodes["Principled BSDF"]
+    bsdf.inputs["Base Color"].default_value = col
+
+    bsdf.inputs["Roughness"].default_value = values[0]
+    bsdf.inputs["Metallic"].default_value = values[1]
+    bsdf.inputs["Transmission Weight"].default_value = values[2]
+    bsdf.inputs["Emission Strength"].default_value = values[3] * 20
+    bsdf.inputs["Emission Color"].default_value = col
+
+def fill_palette_images(col_img, mat_img, palette, materials):
+    # Pixels of the Tex palette textures. The 256th pixel stays black, like the unused 256th color.
+    col_pixels = np.zeros((256, 4), dtype=np.float32)
+    col_pixels[:255] = palette
+    mat_pixels = np.zeros((256, 4), dtype=np.float32)
+    mat_pixels[:255] = materials
+    mat_pixels[:255, 3] /= 5 # Map emit value from [0,5] to [0,1]
+
+    col_img.pixels.foreach_set(col_pixels.ravel())
+    mat_img.pixels.foreach_set(mat_pixels.ravel())
+
+def gamma_colors(options, palette):
+    # Palette colors of SepMat materials, gamma corrected if enabled.
     gamma_value = options.gamma_value
     if not options.gamma_correct:
         gamma_value = 1
 
-    if options.material_type == 'SepMat': # Create material for every palette color.
-        for id, col in enumerate(palette):
-
-            col = (pow(col[0], gamma_value), pow(col[1], gamma_value), pow(col[2], gamma_value), col[3])
+    colors = np.array(palette)
+    colors[:, :3] **= gamma_value
+    return colors.tolist()
 
+def create_materials(file_name, options, palette, materials, digest):
+    # Creates the materials for a palette, named after file_name and tagged with its digest.
+    if options.material_type == 'SepMat': # Create material for every palette color.
+        for id, col in enumerate(gamma_colors(options, palette)):
             name = file_name + " #" + str(id+1)
 
             if name in bpy.data.materials:
@@ -513,18 +2481,8 @@ def import_vox(path, options):
 
             mat = bpy.data.materials.new(name = name)
             mat.use_nodes = True
-            mat.diffuse_color = col
-
-            nodes = mat.node_tree.nodes
-
-            bsdf = nodes["Principled BSDF"]
-            bsdf.inputs["Base Color"].default_value = col
-
-            bsdf.inputs["Roughness"].default_value = materials[id][0]
-            bsdf.inputs["Metallic"].default_value = materials[id][1]
-            bsdf.inputs["Transmission Weight"].default_value = materials[id][2]
-            bsdf.inputs["Emission Strength"].default_value = materials[id][3] * 20
-            bsdf.inputs["Emission Color"].default_value = col
+            tag_material(mat, file_name, digest)
+            set_color_material(mat, col, materials[id])
 
     elif options.material_type == 'VertCol': # Create one material that uses vertex colors.
         name = file_name
@@ -541,6 +2499,7 @@ def import_vox(path, options):
         if create_mat: # Materials don't already exist or materials are being overriden.
             mat = bpy.data.materials.new(name = name)
             mat.use_nodes = True
+            tag_material(mat, file_name, digest)
 
             nodes = mat.node_tree.nodes
             links = mat.node_tree.links
@@ -574,8 +2533,9 @@ def import_vox(path, options):
             if options.override_materials:
                 # Delete material + texture and recreate it.
                 bpy.data.materials.remove(bpy.data.materials[name])
-                bpy.data.images.remove(bpy.data.images[name + '_col'])
-                bpy.data.images.remove(bpy.data.images[name + '_mat'])
+                for image_name in (name + '_col', name + '_mat'):
+                    if image_name in bpy.data.images:
+                        bpy.data.images.remove(bpy.data.images[image_name])
             else:
                 # Don't change materials.
                 create_mat = False
@@ -586,28 +2546,14 @@ def import_vox(path, options):
             col_img = bpy.data.images.new(name + '_col', width = 256, height = 1)
             mat_img = bpy.data.images.new(name + '_mat', width = 256, height = 1)
             mat_img.colorspace_settings.name = 'Non-Color'
-            col_pixels = []
-            mat_pixels = []
-
-            for i in range(255):
-                col = palette[i]
-                mat = materials[i]
-
-                col_pixels += col
-                #                                  Map emit value from [0,5] to [0,1]
-                mat_pixels += [mat[0], mat[1], mat[2], mat[3]/5]
-
-            col_pixels += [0,0,0,0]
-            mat_pixels += [0,0,0,0]
-
-            col_img.pixels = col_pixels
-            mat_img.pixels = mat_pixels
+            fill_palette_images(col_img, mat_img, palette, materials)
 
 
             ## Create Material
 
             mat = bpy.data.materials.new(name = name)
             mat.use_nodes = True
+            tag_material(mat, file_name, digest)
 
             nodes = mat.node_tree.nodes
             links = mat.node_tree.links
@@ -633,23 +2579,53 @@ def import_vox(path, options):
             links.new(mat_tex.outputs["Alpha"], multiply.inputs[0])
             links.new(multiply.outputs[0], bsdf.inputs["Emission Strength"])
 
+def import_vox(vox, options, meshes=None, profiler=None):
+    # meshes are the MeshData of every model, as returned by mesh_vox. They are generated
+    # here when not given. The time spent in each stage is recorded in profiler.
+    file_name = vox.name
+
+    if profiler is None:
+        profiler = Profiler(file_name)
+
+    if meshes is None and not options.proxies:
+        with profiler.stage("mesh"):
+            meshes = mesh_vox(vox, mesh_options(options))
+
+    with profiler.stage("scene graph"):
+        instances = vox.instances()
+
+    with profiler.stage("voxel objects"):
+        palette = (vox.palette[:255] / 255).tolist() # The 256th color is never used.
+        materials = vox.material_properties()
+
+        # Models with the same voxels and mesh, like repeated animation frames, share one
+        # VoxelObject under the first of their ids.
+        models = {}  # {model id : VoxelObject}, empty for proxies since the voxels aren't loaded.
+        shared = list(range(len(vox.models)))  # Model id whose VoxelObject each model uses.
+        if not options.proxies:
+            digests = {}  # {content digest : model id}
+            visible = used_models(instances) # Models only on hidden layers aren't imported.
+            for mod_id, model in enumerate(vox.models):
+                if mod_id not in visible:
+                    continue
+                shared[mod_id] = digests.setdefault(model_digest(model, meshes[mod_id]), mod_id)
+                if shared[mod_id] == mod_id:
+                    models[mod_id] = VoxelObject(model)
 
-    ### Apply Transforms ##
-    for trans_child in transforms:
-        trans = transforms[trans_child]
-
-        if trans_child in groups:
-            group_children = groups[trans_child]
-            # In my testing, group nodes never have valid
-            # children ids. Is the documentation correct?
-
-        if trans_child in shapes:
-            shape_children = shapes[trans_child]
+    ### Import Options ###
+    with profiler.stage("materials"):
+        # Files with the same palette and settings share the materials of the first one.
+        material_name = file_name
+        if options.material_type != 'None':
+            digest = palette_digest(vox, options)
+            material_name = find_palette_materials(digest, options.material_type)
 
-            for model_id in shape_children:
-                models[model_id].position = trans[0]
+            if material_name is None:
+                create_materials(file_name, options, palette, materials, digest)
+                palette_registry[digest] = material_name = file_name
 
     ## Create Collections ##
+    stage = profiler.start("collections")
     collections = (None, None, None)
     if options.organize:
         main = bpy.data.collections.new(file_name)
@@ -672,22 +2648,178 @@ def import_vox(path, options):
 
         collections = (mesh_col, light_col, volume_col)
 
+    # Every LOD level gets its own collection, hidden until it's needed.
+    lod_cols = {}  # {factor : collection}
+    if not options.proxies:
+        lod_cols = create_lod_collections(file_name, lod_factors(options), main if options.organize else bpy.context.scene.collection)
+    profiler.stop(stage)
+
+    ### Plan Lights ###
+    stats = {"faces": 0, "voxel_faces": 0, "emissive_voxels": 0, "lights": 0, "proxies": 0, "lod_faces": 0, "volume_voxels": 0}
+    stage = profiler.start("plan lights")
+    if collections[1] != None and not options.proxies: # Proxies get their lights when realized.
+        uses = [0] * len(vox.models)
+        for instance in instances:
+            uses[shared[instance.model_id]] += 1
+
+        emission = emission_strengths(materials)
+        plan = plan_lights([model.voxels for model in vox.models], uses, emission, options.light_cluster_size, options.max_lights)
+        for mod_id, (colors, centers, counts) in enumerate(plan):
+            if mod_id not in models: # Shares the VoxelObject of another model.
+                continue
+
+            model = models[mod_id]
+            model.light_colors, model.light_centers, model.light_counts = colors, centers, counts
+
+            stats["emissive_voxels"] += int(np.count_nonzero(emission[model.colors] > 0)) * uses[mod_id]
+            stats["lights"] += len(colors) * uses[mod_id]
+    profiler.stop(stage)
+
     ### Generate Objects ###
-    for model in models.values():
-        model.generate(file_name, options.voxel_size, options.material_type, palette, materials, options.cleanup_mesh, collections)
+    if options.proxies:
+        with profiler.stage("proxies"):
+            settings = proxy_settings(options)
+            for instance in instances:
+                add_proxy(vox, instance, settings, collections[0])
+            stats["proxies"] = len(instances)
+
+    for mod_id, model in models.items(): # Every model is meshed once, no matter how often it's used.
+        faces, voxel_faces = model.generate(file_name, meshes[mod_id], options.voxel_size, options.material_type,
+                                            palette, materials, profiler, material_name)
+        stats["faces"] += faces
+        stats["voxel_faces"] += voxel_faces
+
+    # Glass and media voxels, left out of the meshes by mesh_vox().
+    if use_volumes(options) and models:
+        densities = vox.volume_densities()
+        if densities.any():
+            volume_material = create_volume_material(file_name)
+            directory = volume_directory()
+            for model in models.values():
+                stats["volume_voxels"] += model.generate_volume(file_name, directory, densities, vox.palette, volume_material, profiler)
+
+    # LOD meshes follow the full meshes in meshes, see mesh_vox().
+    for level, factor in enumerate(lod_cols):
+        lod_meshes = meshes[(level+1) * len(vox.models):(level+2) * len(vox.models)]
+        for mod_id, model in models.items():
+            stats["lod_faces"] += model.generate_lod(file_name, factor, lod_meshes[mod_id], options.material_type,
+                                                     palette, materials, profiler, material_name)
+
+    if models and vox.path is not None:
+        with profiler.stage("tag meshes"): # What sync_file() needs to update them later.
+            settings = json.dumps(proxy_settings(options))
+            digest = palette_digest(vox, options)
+            densities = vox.volume_densities()
+            for mod_id, model in models.items():
+                hash = mesh_hash(model.model, options, digest, densities)
+                for factor, mesh in [(0, model.mesh)] + list(model.lod_meshes.items()):
+                    if mesh is not None:
+                        tag_mesh(mesh, vox.path, mod_id, factor, settings, hash, digest)
+
+    if not options.proxies:
+        with profiler.stage("instances"):
+            blank_mesh = None # Shown on frames whose model is empty.
+
+            for instance in instances:
+                # The object is made from the first frame with a mesh, the other frames are swapped in.
+                frame_models = [(frame, mod_id, models[shared[mod_id]]) for frame, mod_id in instance.model_frames]
+                mod_id, model = instance.model_id, models[shared[instance.model_id]]
+                for _, frame_id, frame_model in frame_models:
+                    if frame_model.mesh is not None:
+                        mod_id, model = frame_id, frame_model
+                        break
+
+                matrix = instance_matrix(instance.translation, instance.rotation, options.voxel_size)
+                obj = model.add_instance(file_name, matrix, collections)
+                for lod_obj in model.add_lod_instances(file_name, matrix, lod_cols):
+                    lod_obj["vox_model"] = mod_id
+                if obj is not None:
+                    obj["vox_model"] = mod_id # Models with the same voxels share a mesh, see sync_meshes().
+
+                if obj is None or not (instance.keyframes or frame_models):
+                    continue
+
+                frame_meshes = []
+                for frame, frame_id, frame_model in frame_models:
+                    if frame_model.mesh is None and blank_mesh is None:
+                        blank_mesh = bpy.data.meshes.new(file_name + "_empty")
+                    frame_meshes.append((frame, frame_model.mesh or blank_mesh, frame_id))
+
+                animate_instance(obj, instance, frame_meshes, options.voxel_size, bpy.context.scene.frame_start)
+
+    return stats
+
+def action_fcurves(action):
+    if hasattr(action, "fcurves"):
+        return action.fcurves
+    # Layered actions keep their F-Curves in channel bags since Blender 5.0.
+    return [fcurve for layer in action.layers for strip in layer.strips for bag in strip.channelbags for fcurve in bag.fcurves]
+
+def animate_instance(obj, instance, frame_meshes, vox_size, frame_start):
+    # Keyframes the location of an instance under animated transforms, and its rotation when
+    # that changes too. For shapes with a model per frame, frame_meshes is [(frame index, mesh,
+    # model id)] and swap_frame_meshes() changes the mesh as the frame changes.
+    rotated = len(set(rotation for _, _, rotation in instance.keyframes)) > 1
+    for frame, translation, rotation in instance.keyframes:
+        obj.matrix_world = instance_matrix(translation, rotation, vox_size)
+        obj.keyframe_insert("location", frame=frame_start + frame)
+        if rotated: # Mirroring rotations end up as negative scale.
+            obj.keyframe_insert("rotation_euler", frame=frame_start + frame)
+            obj.keyframe_insert("scale", frame=frame_start + frame)
+
+    if instance.keyframes:
+        for fcurve in action_fcurves(obj.animation_data.action):
+            for point in fcurve.keyframe_points:
+                point.interpolation = 'CONSTANT' # MagicaVoxel holds each key until the next one.
+
+    if frame_meshes:
+        obj["vox_frames"] = json.dumps([[frame_start + frame, mesh.name, model_id] for frame, mesh, model_id in frame_meshes])
+
+def swap_frame_meshes(scene, depsgraph=None):
+    # frame_change_pre handler that gives objects with a model per frame the mesh of the current
+    # frame.
+    for obj in scene.objects:
+        if "vox_frames" in obj:
+            show_frame_mesh(obj, scene.frame_current)
+
+def show_frame_mesh(obj, current):
+    # Gives an object with a model per frame the mesh of frame current. Each mesh is shown
+    # until the next frame that has one, the first one before that.
+    frames = json.loads(obj["vox_frames"])
+    name = frames[0][1]
+    for frame, mesh_name, *_ in frames: # Files imported before the model id was stored only have two.
+        if frame > current:
+            break
+        name = mesh_name
+
+    mesh = bpy.data.meshes.get(name)
+    if mesh is not None and obj.data != mesh:
+        obj.data = mesh
 
 ################################################################################################################################################
 
 def menu_func_import(self, context):
     self.layout.operator(ImportVox.bl_idname, text="MagicaVoxel (.vox)")
 
+def menu_func_object(self, context):
+    self.layout.operator(RealizeVoxProxies.bl_idname)
+    self.layout.operator(ReimportVox.bl_idname)
+
 def register():
     bpy.utils.register_class(ImportVox)
+    bpy.utils.register_class(RealizeVoxProxies)
+    bpy.utils.register_class(ReimportVox)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.VIEW3D_MT_object.append(menu_func_object)
+    bpy.app.handlers.frame_change_pre.append(bpy.app.handlers.persistent(swap_frame_meshes)) # Kept when other files are loaded.
 
 def unregister():
     bpy.utils.unregister_class(ImportVox)
+    bpy.utils.unregister_class(RealizeVoxProxies)
+    bpy.utils.unregister_class(ReimportVox)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.VIEW3D_MT_object.remove(menu_func_object)
+    bpy.app.handlers.frame_change_pre.remove(swap_frame_meshes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+# Compares the memory used per voxel by VoxelObject against the original Vec3 and dict storage.
+#
+#   python benchmarks/bench_memory.py [--no-legacy]
+#
+# Memory is the tracemalloc size of everything VoxelObject allocates while it's built, not
+# counting the parsed voxel array it's built from.
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import MagicaVoxel_Importer as importer
+import legacy
+import synthetic
+
+EDGES = (32, 64, 128)
+
+
+def allocated(func):
+    # Returns the bytes still held by func's result once it returns, along with the result.
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+def main(args):
+    run_legacy = '--no-legacy' not in args
+
+    header = "%6s %10s %12s" % ("edge", "voxels", "bytes/voxel")
+    if run_legacy:
+        header += " %14s %10s" % ("legacy b/voxel", "ratio")
+    print(header)
+    for edge in EDGES:
+        voxels = synthetic.terrain(edge)
+        model = importer.VoxModel((edge, edge, edge), voxels)
+        count = len(voxels)
+
+        size, obj = allocated(lambda: importer.VoxelObject(model))
+        row = (edge, count, size / count)
+
+        if run_legacy:
+            voxel_list = voxels.tolist()
+            legacy_size, legacy_obj = allocated(lambda: legacy.VoxelObject(voxel_list, None))
+            print("%6d %10d %12.2f %14.1f %9.0fx" % (row + (legacy_size / count, legacy_size / size)))
+            del legacy_obj
+        else:
+            print("%6d %10d %12.2f" % row)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,50 @@
+# Compares the vectorized mesher against the original per-voxel compareVox loop.
+#
+#   python benchmarks/bench_mesh.py [--no-legacy]
+#
+# Models are 16 color heightmap terrains. The legacy loop takes several minutes at 256^3, and
+# there its 256 stride voxel index wraps around and drops faces on the x = 255 and y = 255 borders.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import MagicaVoxel_Importer as importer
+import legacy
+import synthetic
+
+EDGES = (64, 128, 256)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main(args):
+    run_legacy = '--no-legacy' not in args
+
+    header = "%6s %10s %10s %10s" % ("edge", "voxels", "faces", "numpy s")
+    if run_legacy:
+        header += " %12s %10s %10s" % ("legacy faces", "legacy s", "speedup")
+    print(header)
+    for edge in EDGES:
+        voxels = synthetic.terrain(edge)
+        model = importer.VoxModel((edge, edge, edge), voxels)
+
+        elapsed, mesh = timed(lambda: importer.mesh_grid(model.grid))
+        row = (edge, len(voxels), len(mesh.faces), elapsed)
+
+        if run_legacy:
+            legacy_elapsed, geometry = timed(lambda: legacy.VoxelObject(voxels.tolist(), None).generate_geometry())
+            legacy_faces = sum(len(faces) for _, faces in geometry.values())
+            print("%6d %10d %10d %10.3f %12d %10.3f %9.0fx" % (row + (legacy_faces, legacy_elapsed, legacy_elapsed / elapsed)))
+        else:
+            print("%6d %10d %10d %10.3f" % row)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,51 @@
+# Times .vox parsing on solid cubes of increasing size inside a 256^3 model.
+#
+#   python benchmarks/bench_parse.py [--legacy]
+#
+# Parse time per voxel should stay flat as the file grows.
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import MagicaVoxel_Importer as importer
+import legacy
+import synthetic
+
+EDGES = (32, 64, 128, 256)
+LEGACY_MAX_EDGE = 128  # The legacy loop takes minutes on a full 256^3 cube.
+
+
+def best_of(func, path, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(args):
+    run_legacy = '--legacy' in args
+
+    print("%6s %10s %10s %10s %12s" % ("edge", "voxels", "MB", "parse s", "ns/voxel"))
+    with tempfile.TemporaryDirectory() as directory:
+        for edge in EDGES:
+            path = os.path.join(directory, "cube_%d.vox" % edge)
+            synthetic.write_vox(path, (256, 256, 256), synthetic.solid_cube(edge))
+            count = edge**3
+            megabytes = os.path.getsize(path) / 2**20
+
+            elapsed = best_of(importer.VoxFile.load, path)
+            print("%6d %10d %10.1f %10.3f %12.1f" % (edge, count, megabytes, elapsed, elapsed / count * 1e9))
+
+            if run_legacy and edge <= LEGACY_MAX_EDGE:
+                elapsed = best_of(legacy.read_voxels, path, repeat=1)
+                print("%6s %10s %10s %10.3f %12.1f  (legacy)" % ("", "", "", elapsed, elapsed / count * 1e9))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,47 @@
+# Times scene graph evaluation, VoxFile.instances(), on deep trees of transform nodes with and
+# without rotations.
+#
+#   python benchmarks/bench_scene.py
+#
+# Time per node should stay flat as the tree grows, rotations shouldn't cost much more.
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import MagicaVoxel_Importer as importer
+import synthetic
+
+DEPTHS = (1000, 4000, 16000)
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(args):
+    print("%8s %8s %10s %10s %12s" % ("depth", "rotate", "nodes", "eval s", "us/node"))
+    with tempfile.TemporaryDirectory() as directory:
+        for depth in DEPTHS:
+            for rotate in (False, True):
+                path = os.path.join(directory, "deep_%d.vox" % depth)
+                models, nodes = synthetic.deep_scene(depth, rotate=rotate)
+                synthetic.write_scene(path, models, nodes=nodes)
+
+                vox = importer.VoxFile.load(path)
+                count = len(vox.transforms) + len(vox.groups) + len(vox.shapes)
+
+                elapsed = best_of(vox.instances)
+                print("%8d %8s %10d %10.3f %12.2f" % (depth, rotate, count, elapsed, elapsed / count * 1e6))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
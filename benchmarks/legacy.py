@@ -0,0 +1,116 @@
+# Reference copies of the original implementations, kept so benchmarks can compare against them.
+
+import struct
+
+
+def read_chunk(buffer):
+    *name, h_size, h_children = struct.unpack('<4cii', buffer.read(12))
+    name = b"".join(name)
+    content = bytearray(buffer.read(h_size))
+    return name, content
+
+def read_content(content, size):
+    out = content[:size]
+    del content[:size]
+
+    return out
+
+def read_voxels(path):
+    # The original SIZE/XYZI/RGBA decode loop, without building any objects.
+    models = []
+
+    with open(path, 'rb') as file:
+        file.seek(0, 2)
+        file_size = file.tell()
+        file.seek(20)
+
+        while file.tell() < file_size:
+            name, content = read_chunk(file)
+
+            if name == b'XYZI':
+                voxels = []
+
+                num_voxels, = struct.unpack('<i', read_content(content, 4))
+                for voxel in range(num_voxels):
+                    voxel_data = struct.unpack('<4B', read_content(content, 4))
+                    voxels.append(voxel_data)
+
+                models.append(voxels)
+
+            elif name == b'RGBA':
+                palette = []
+                for _ in range(255):
+                    rgba = struct.unpack('<4B', read_content(content, 4))
+                    palette.append([float(col)/255 for col in rgba])
+                del content[:4]
+
+    return models
+
+
+class Vec3:
+    def __init__(self, X, Y, Z):
+        self.x, self.y, self.z = X, Y, Z
+
+    def _index(self):
+        return self.x + self.y*256 + self.z*256*256
+
+class VoxelObject:
+    def __init__(self, Voxels, Size):
+        self.size = Size
+        self.voxels = {}
+        self.used_colors = []
+        self.position = Vec3(0, 0, 0)
+        self.rotation = Vec3(0, 0, 0)
+
+        for vox in Voxels:
+            pos = Vec3(vox[0], vox[1], vox[2])
+            self.voxels[pos._index()] = (pos, vox[3])
+
+            if vox[3] not in self.used_colors:
+                self.used_colors.append(vox[3])
+
+    def getVox(self, pos):
+        key = pos._index()
+        if key in self.voxels:
+            return self.voxels[key][1]
+
+        return 0
+
+    def compareVox(self, colA, b):
+        colB = self.getVox(b)
+
+        if colB == 0:
+            return False
+        return True
+
+    def generate_geometry(self):
+        # The per-color face loop of the original generate(), without the Blender calls.
+        # Returns {color id : (verts, faces)}.
+        geometry = {}
+
+        for Col in self.used_colors:
+            verts = []
+            faces = []
+
+            for key in self.voxels:
+                pos, colID = self.voxels[key]
+                x, y, z = pos.x, pos.y, pos.z
+
+                if colID != Col:
+                    continue
+
+                for neighbor, quad in (
+                        (Vec3(x+1, y, z), ((x+1, y, z), (x+1, y+1, z), (x+1, y+1, z+1), (x+1, y, z+1))),
+                        (Vec3(x, y+1, z), ((x+1, y+1, z), (x+1, y+1, z+1), (x, y+1, z+1), (x, y+1, z))),
+                        (Vec3(x, y, z+1), ((x, y, z+1), (x, y+1, z+1), (x+1, y+1, z+1), (x+1, y, z+1))),
+                        (Vec3(x-1, y, z), ((x, y, z), (x, y+1, z), (x, y+1, z+1), (x, y, z+1))),
+                        (Vec3(x, y-1, z), ((x, y, z), (x, y, z+1), (x+1, y, z+1), (x+1, y, z))),
+                        (Vec3(x, y, z-1), ((x, y, z), (x+1, y, z), (x+1, y+1, z), (x, y+1, z)))):
+
+                    if not self.compareVox(colID, neighbor):
+                        verts.extend(quad)
+                        faces.append([len(verts)-4, len(verts)-3, len(verts)-2, len(verts)-1])
+
+            geometry[Col] = (verts, faces)
+
+        return geometry
@@ -0,0 +1,192 @@
+# Imports synthetic .vox files and writes the timings of every import stage as JSON.
+#
+#   blender --background --factory-startup --python benchmarks/run.py -- [options]
+#   python benchmarks/run.py [options]
+#
+#   --output PATH      Where the results are written, bench_results.json by default.
+#   --compare PATH     Results of an earlier run. Cases that got slower by more than 10% are
+#                      listed and the exit status is 1.
+#   --filter TEXT      Only run cases with TEXT in their name.
+#   --repeat N         Runs per case, the fastest one is kept. 3 by default.
+#
+# Inside Blender every case goes through the import_scene.vox operator, with the stage timings
+# taken from its trace file. Plain python can only time reading, parsing and meshing.
+
+import json
+import os
+import platform
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import MagicaVoxel_Importer as importer
+import synthetic
+
+bpy = importer.bpy
+
+REGRESSION_THRESHOLD = 1.1
+
+
+def single(voxels, edge=256):
+    return [((edge, edge, edge), voxels)], []
+
+def tiled():
+    return synthetic.tiled_scene(8, 64)
+
+def layered():
+    return synthetic.layered_scene(8, 64, visible=8)
+
+def instanced():
+    return synthetic.instanced_scene(500, 32)
+
+def deep():
+    return synthetic.deep_scene(1000)
+
+def deep_rotated():
+    return synthetic.deep_scene(1000, rotate=True)
+
+def animated():
+    return synthetic.animated_scene(48, 64)
+
+# (name, models and scene nodes, palette, materials, operator options)
+CASES = [
+    ("cube_128", lambda: single(synthetic.solid_cube(128)), None, None, {}),
+    ("terrain_256", lambda: single(synthetic.terrain(256)), None, None, {}),
+    ("terrain_256_greedy", lambda: single(synthetic.terrain(256)), None, None, {"meshing": 'Greedy'}),
+    ("terrain_256_bricks", lambda: single(synthetic.terrain(256)), None, None, {"brick_size": 64}),
+    ("noise_128", lambda: single(synthetic.noise(128, 0.3), 128), None, None, {}),
+    ("points_256", lambda: single(synthetic.point_cloud(256, 100000)), None, None, {}),
+    ("points_256_points", lambda: single(synthetic.point_cloud(256, 100000)), None, None, {"meshing": 'Points'}),
+    ("terrain_256_points", lambda: single(synthetic.terrain(256)), None, None, {"meshing": 'Points'}),
+    ("tiled_8x8", tiled, None, None, {}),
+    ("layered_8x8_hidden", layered, None, None, {}),
+    ("instanced_500", instanced, None, None, {}),
+    ("deep_1000", deep, None, None, {}),
+    ("deep_1000_rotated", deep_rotated, None, None, {"scene_culling": True}),
+    ("animated_48", animated, None, None, {}),
+    ("palette_sepmat", lambda: single(synthetic.noise(64, 0.5), 64), synthetic.full_palette(), synthetic.mixed_materials(8, 5, 7),
+        {"material_type": 'SepMat', "create_lights": True, "light_cluster_size": 8}),
+    ("palette_vertcol", lambda: single(synthetic.noise(64, 0.5), 64), synthetic.full_palette(), synthetic.mixed_materials(8, 5, 7),
+        {"material_type": 'VertCol'}),
+    ("palette_tex", lambda: single(synthetic.noise(64, 0.5), 64), synthetic.full_palette(), synthetic.mixed_materials(8, 5, 7),
+        {"material_type": 'Tex'}),
+]
+
+
+def parse_args(args):
+    if '--' in args: # Blender passes its own arguments before '--'.
+        args = args[args.index('--')+1:]
+    elif bpy is not None:
+        args = []
+
+    settings = {"output": "bench_results.json", "compare": None, "filter": "", "repeat": 3}
+    for flag, value in zip(args[::2], args[1::2]):
+        settings[flag.lstrip('-')] = int(value) if flag == '--repeat' else value
+    return settings
+
+def run_blender(path, options, trace_path):
+    # Imports into an empty scene, returns the trace of the import and the created geometry.
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if not hasattr(bpy.types, "IMPORT_SCENE_OT_vox"): # Unregistered by the reset, or never registered.
+        importer.register()
+
+    bpy.ops.import_scene.vox(filepath=path, trace_file=trace_path, **options)
+
+    with open(trace_path) as file:
+        trace, = json.load(file)["files"]
+
+    trace["faces"] = sum(len(mesh.polygons) for mesh in bpy.data.meshes)
+    trace["points"] = sum(len(mesh.vertices) for mesh in bpy.data.meshes if not mesh.polygons)
+    trace["objects"] = len(bpy.data.objects)
+    return trace
+
+def run_headless(path, options, trace_path):
+    meshing = options.get("meshing")
+    mesh_options = importer.MeshOptions(meshing == 'Greedy', options.get("cleanup_mesh", True), options.get("brick_size", 0),
+                                        points=meshing == 'Points')
+
+    profiler = importer.Profiler(path)
+    vox, meshes = importer.prepare_file(path, mesh_options, None, profiler)
+
+    trace = profiler.trace()
+    trace["faces"] = sum(len(mesh.faces) for mesh in meshes)
+    trace["points"] = sum(len(mesh.vertices) for mesh in meshes if mesh.points)
+    return trace
+
+def compare(results, path):
+    # Returns the names of the cases that are slower than in the results at path.
+    with open(path) as file:
+        previous = {case["name"]: case for case in json.load(file)["cases"]}
+
+    regressions = []
+    for case in results["cases"]:
+        before = previous.get(case["name"])
+        if before is None:
+            continue
+
+        ratio = case["seconds"] / max(before["seconds"], 1e-9)
+        print("%-22s %10.3f %10.3f %8.2fx" % (case["name"], before["seconds"], case["seconds"], ratio))
+        if ratio > REGRESSION_THRESHOLD:
+            regressions.append(case["name"])
+
+    return regressions
+
+def main(args):
+    settings = parse_args(args)
+    run = run_headless if bpy is None else run_blender
+
+    results = {
+        "importer_version": list(importer.bl_info["version"]),
+        "blender": bpy.app.version_string if bpy is not None else None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cases": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        trace_path = os.path.join(directory, "trace.json")
+
+        for name, build, palette, materials, options in CASES:
+            if settings["filter"] not in name:
+                continue
+
+            models, nodes = build()
+            path = os.path.join(directory, name + ".vox")
+            synthetic.write_scene(path, models, palette, materials, nodes)
+
+            best = None
+            for _ in range(settings["repeat"]):
+                trace = run(path, options, trace_path)
+                if best is None or trace["seconds"] < best["seconds"]:
+                    best = trace
+
+            case = {
+                "name": name,
+                "options": options,
+                "file_bytes": os.path.getsize(path),
+                "models": len(models),
+                "voxels": sum(len(voxels) for _, voxels in models),
+            }
+            case.update(best)
+            del case["file"]
+            results["cases"].append(case)
+
+            print("%-22s %10.3fs %10d faces" % (name, case["seconds"], case["faces"]))
+
+    with open(settings["output"], 'w') as file:
+        json.dump(results, file, indent=1)
+
+    if settings["compare"]:
+        regressions = compare(results, settings["compare"])
+        if regressions:
+            print("Slower than before: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,274 @@
+# Writes synthetic .vox files for the benchmarks.
+#
+# Models are (size, voxels) pairs where voxels is an (N, 4) uint8 array of x, y, z, color id.
+# Scene graphs are lists of node chunks made with transform_node, group_node and shape_node.
+
+import struct
+
+import numpy as np
+
+
+################################################################################################################################################
+## Chunks
+
+def chunk(name, content=b'', children=b''):
+    return struct.pack('<4sii', name, len(content), len(children)) + content + children
+
+def string_bytes(value):
+    value = str(value).encode('utf-8')
+    return struct.pack('<i', len(value)) + value
+
+def dict_bytes(values):
+    out = struct.pack('<i', len(values))
+    for key, value in values.items():
+        out += string_bytes(key) + string_bytes(value)
+    return out
+
+def transform_node(id, child_id, translation=None, layer_id=0, attributes=None, frames=None, rotation=None):
+    # nTRN chunk. frames is a list of frame dicts, or None for a single frame at translation,
+    # rotated by the packed rotation byte rotation.
+    if frames is None:
+        frames = [{'_t': "%d %d %d" % translation}] if translation is not None else [{}]
+        if rotation is not None:
+            frames[0]['_r'] = str(rotation)
+
+    content = struct.pack('<i', id) + dict_bytes(attributes or {})
+    content += struct.pack('<4i', child_id, -1, layer_id, len(frames))
+    for frame in frames:
+        content += dict_bytes(frame)
+    return chunk(b'nTRN', content)
+
+def group_node(id, children, attributes=None):
+    content = struct.pack('<i', id) + dict_bytes(attributes or {})
+    content += struct.pack('<i', len(children)) + struct.pack('<%di' % len(children), *children)
+    return chunk(b'nGRP', content)
+
+def shape_node(id, model_ids, attributes=None, frames=None):
+    # frames is the animation frame index of each model, for shapes with a model per frame.
+    content = struct.pack('<i', id) + dict_bytes(attributes or {})
+    content += struct.pack('<i', len(model_ids))
+    for i, model_id in enumerate(model_ids):
+        content += struct.pack('<i', model_id) + dict_bytes({'_f': frames[i]} if frames else {})
+    return chunk(b'nSHP', content)
+
+def material_chunk(id, properties):
+    return chunk(b'MATL', struct.pack('<i', id) + dict_bytes(properties))
+
+def layer_chunk(id, name="", hidden=False):
+    return chunk(b'LAYR', struct.pack('<i', id) + dict_bytes({'_name': name, '_hidden': int(hidden)}) + struct.pack('<i', -1))
+
+def render_chunks(size=0):
+    # rOBJ, rCAM, NOTE and IMAP chunks like MagicaVoxel writes, plus an unknown chunk of size
+    # bytes standing in for large auxiliary data.
+    chunks = chunk(b'rOBJ', dict_bytes({'_type': '_bloom', '_mix': '0.5'}))
+    chunks += chunk(b'rCAM', struct.pack('<i', 0) + dict_bytes({'_mode': 'pers', '_fov': '45'}))
+    chunks += chunk(b'NOTE', struct.pack('<i', 2) + string_bytes("wood") + string_bytes("stone"))
+    chunks += chunk(b'IMAP', bytes(range(256)))
+    if size:
+        chunks += chunk(b'AUXD', bytes(size))
+    return chunks
+
+def write_scene(path, models, palette=None, materials=None, nodes=()):
+    # materials is {material id : {property : value}}, nodes are scene graph chunks.
+    if palette is None:
+        palette = np.full((256, 4), 255, dtype=np.uint8)
+
+    children = b''
+    for size, voxels in models:
+        voxels = np.ascontiguousarray(voxels, dtype=np.uint8)
+        children += chunk(b'SIZE', struct.pack('<3i', *size))
+        children += chunk(b'XYZI', struct.pack('<i', len(voxels)) + voxels.tobytes())
+
+    children += b''.join(nodes)
+    children += chunk(b'RGBA', np.ascontiguousarray(palette, dtype=np.uint8).tobytes())
+
+    for id, properties in (materials or {}).items():
+        children += material_chunk(id, properties)
+
+    with open(path, 'wb') as file:
+        file.write(struct.pack('<4si', b'VOX ', 0xc8))
+        file.write(chunk(b'MAIN', children=children))
+
+def write_vox(path, size, voxels, palette=None):
+    # Single model file without a scene graph.
+    write_scene(path, [(size, voxels)], palette)
+
+################################################################################################################################################
+## Models
+
+def solid_cube(edge, color=1):
+    # (N, 4) array of x, y, z, color id filling an edge^3 cube.
+    axis = np.arange(edge, dtype=np.uint8)
+    x, y, z = np.meshgrid(axis, axis, axis, indexing='ij')
+    voxels = np.empty((edge**3, 4), dtype=np.uint8)
+    voxels[:, 0], voxels[:, 1], voxels[:, 2] = x.ravel(), y.ravel(), z.ravel()
+    voxels[:, 3] = color
+    return voxels
+
+def terrain(edge, colors=16, seed=0):
+    # (N, 4) heightmap terrain filling an edge^3 model, colored in horizontal bands.
+    rng = np.random.default_rng(seed)
+    axis = np.arange(edge) / edge * 2 * np.pi
+    x, y = np.meshgrid(axis, axis, indexing='ij')
+
+    height = np.zeros((edge, edge))
+    for octave in range(1, 5):
+        phase = rng.uniform(0, 2 * np.pi, 2)
+        height += np.sin(x * octave + phase[0]) * np.cos(y * octave + phase[1]) / octave
+    height = ((height - height.min()) / np.ptp(height) * (edge - 1)).astype(np.int64) + 1
+
+    z = np.arange(edge)
+    filled = z[np.newaxis, np.newaxis, :] < height[:, :, np.newaxis]
+    coords = np.argwhere(filled)
+
+    voxels = np.empty((len(coords), 4), dtype=np.uint8)
+    voxels[:, :3] = coords
+    voxels[:, 3] = coords[:, 2] * colors // edge + 1
+    return voxels
+
+def noise(edge, density=0.5, colors=255, seed=0):
+    # Every voxel of an edge^3 model filled with probability density, in random colors. The
+    # worst case for face culling and greedy meshing.
+    rng = np.random.default_rng(seed)
+    coords = np.argwhere(rng.random((edge, edge, edge)) < density)
+
+    voxels = np.empty((len(coords), 4), dtype=np.uint8)
+    voxels[:, :3] = coords
+    voxels[:, 3] = rng.integers(1, colors + 1, len(coords))
+    return voxels
+
+def point_cloud(edge, count, colors=255, seed=0):
+    # count voxels at distinct random positions in an edge^3 model.
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(edge**3, size=min(count, edge**3), replace=False)
+
+    voxels = np.empty((len(cells), 4), dtype=np.uint8)
+    voxels[:, :3] = np.stack(np.unravel_index(cells, (edge, edge, edge)), axis=1)
+    voxels[:, 3] = rng.integers(1, colors + 1, len(cells))
+    return voxels
+
+################################################################################################################################################
+## Palettes and Materials
+
+def full_palette(seed=0):
+    # (256, 4) palette with 255 distinct random opaque colors.
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 256, (256, 4), dtype=np.uint8)
+    palette[:, 3] = 255
+    return palette
+
+def mixed_materials(emissive_every=8, glass_every=0, metal_every=0):
+    # MATL entries for every palette index, with every nth one emissive, glass or metal and
+    # the rest diffuse.
+    materials = {}
+    for id in range(1, 256):
+        if emissive_every and id % emissive_every == 0:
+            materials[id] = {'_type': '_emit', '_emit': '0.5', '_flux': '1'}
+        elif glass_every and id % glass_every == 0:
+            materials[id] = {'_type': '_glass', '_alpha': '0.5', '_rough': '0.1', '_ior': '0.3'}
+        elif metal_every and id % metal_every == 0:
+            materials[id] = {'_type': '_metal', '_metal': '1.0', '_rough': '0.2'}
+        else:
+            materials[id] = {'_type': '_diffuse'}
+    return materials
+
+################################################################################################################################################
+## Scenes
+
+def tiled_scene(tiles, edge, seed=0):
+    # tiles^2 terrain models placed side by side on a grid, like a large world split into
+    # tiles. Returns (models, nodes).
+    models = [((edge, edge, edge), terrain(edge, seed=seed + i)) for i in range(tiles * tiles)]
+
+    nodes = [transform_node(0, 1)]
+    children = []
+    node_id = 2
+    for i in range(tiles * tiles):
+        x, y = divmod(i, tiles)
+        nodes.append(transform_node(node_id, node_id + 1, (x * edge, y * edge, edge // 2)))
+        nodes.append(shape_node(node_id + 1, [i]))
+        children.append(node_id)
+        node_id += 2
+    nodes.insert(1, group_node(1, children))
+
+    return models, nodes
+
+def layered_scene(tiles, edge, visible=1, seed=0):
+    # tiled_scene() with only the first visible tiles on a visible layer, the rest on a
+    # hidden one. Returns (models, nodes).
+    models, nodes = tiled_scene(tiles, edge, seed)
+
+    # Rewrite the tile transforms, which follow the root transform and group, with layers.
+    for i in range(tiles * tiles):
+        x, y = divmod(i, tiles)
+        node_id = 2 + i * 2
+        nodes[2 + i * 2] = transform_node(node_id, node_id + 1, (x * edge, y * edge, edge // 2), layer_id=int(i >= visible))
+
+    nodes += [layer_chunk(0, "shown"), layer_chunk(1, "hidden", hidden=True)]
+    return models, nodes
+
+def instanced_scene(count, edge, seed=0):
+    # One model used count times, scattered with random translations. Returns (models, nodes).
+    rng = np.random.default_rng(seed)
+    models = [((edge, edge, edge), terrain(edge, seed=seed))]
+
+    nodes = [transform_node(0, 1)]
+    children = []
+    for i in range(count):
+        node_id = 2 + i * 2
+        translation = tuple(rng.integers(-1000, 1000, 3).tolist())
+        nodes.append(transform_node(node_id, node_id + 1, translation))
+        nodes.append(shape_node(node_id + 1, [0]))
+        children.append(node_id)
+    nodes.insert(1, group_node(1, children))
+
+    return models, nodes
+
+# Packed rotation bytes of a quarter turn around z, a half turn around x and a mirror along y.
+ROTATIONS = (0b0010001, 0b1100100, 0b0100100)
+
+def deep_scene(depth, fanout=2, edge=8, seed=0, rotate=False):
+    # Tree of nTRN/nGRP pairs depth levels deep, fanout children per group, with a shape using
+    # a small model at every leaf. With rotate, the transforms cycle through ROTATIONS.
+    # Returns (models, nodes).
+    models = [((edge, edge, edge), terrain(edge, seed=seed))]
+    nodes = []
+    next_id = [0]
+
+    def new_id():
+        next_id[0] += 1
+        return next_id[0] - 1
+
+    # Iterative, deep trees would hit the recursion limit.
+    root = new_id()
+    stack = [(root, 0)]
+    while stack:
+        transform_id, level = stack.pop()
+        child_id = new_id()
+        rotation = ROTATIONS[transform_id % len(ROTATIONS)] if rotate else None
+        nodes.append(transform_node(transform_id, child_id, (1, 0, 1), rotation=rotation))
+
+        if level == depth:
+            nodes.append(shape_node(child_id, [0]))
+            continue
+
+        # Only the first child of each group keeps going down, so the node count grows linearly.
+        children = [new_id() for _ in range(fanout)]
+        nodes.append(group_node(child_id, children))
+        stack.append((children[0], level + 1))
+        for leaf_id in children[1:]:
+            stack.append((leaf_id, depth))
+
+    return models, nodes
+
+def animated_scene(frames, edge, distinct=4, seed=0):
+    # A shape with a model for each of frames frames, cycling through distinct different models,
+    # under a transform that moves on every frame. Returns (models, nodes).
+    shapes = [terrain(edge, seed=seed + i) for i in range(distinct)]
+    models = [((edge, edge, edge), shapes[frame % distinct]) for frame in range(frames)]
+
+    keyframes = [{'_f': frame, '_t': "%d 0 0" % (frame * 2)} for frame in range(frames)]
+    nodes = [transform_node(0, 1, frames=keyframes),
+             shape_node(1, list(range(frames)), frames=list(range(frames)))]
+
+    return models, nodes
@@ -0,0 +1,222 @@
+# Checks the numpy parts of the importer against brute force versions. Runs without Blender:
+#
+#   python -m pytest tests
+
+import itertools
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import MagicaVoxel_Importer as importer
+import legacy
+import synthetic
+
+# Every packed _r byte that is a valid rotation.
+ROTATIONS = [value for value in range(128) if (value & 3) < 3 and (value >> 2 & 3) < 3 and (value & 3) != (value >> 2 & 3)]
+
+
+def random_grid(size, density=0.4, colors=4, seed=0):
+    rng = np.random.default_rng(seed)
+    return ((rng.random(size) < density) * rng.integers(1, colors + 1, size)).astype(np.uint8)
+
+def grid_voxels(grid):
+    cells = np.argwhere(grid)
+    return np.column_stack((cells, grid[cells[:, 0], cells[:, 1], cells[:, 2]])).astype(np.uint8)
+
+def face_set(mesh):
+    # Faces as (color, corners) pairs, which don't depend on vertex order or welding.
+    corners = mesh.vertices[mesh.faces]
+    return sorted((int(color), tuple(sorted(map(tuple, quad.tolist())))) for color, quad in zip(mesh.colors, corners))
+
+def unit_faces(mesh):
+    # Splits merged faces back into the unit faces they cover.
+    faces = []
+    for color, quad in zip(mesh.colors.tolist(), mesh.vertices[mesh.faces]):
+        low, high = quad.min(axis=0), quad.max(axis=0)
+        axis = int(np.flatnonzero(low == high)[0])
+        ranges = [range(low[i], high[i]) if i != axis else [low[i]] for i in range(3)]
+        faces += [(color, axis, cell) for cell in itertools.product(*ranges)]
+    return sorted(faces)
+
+
+################################################################################################################################################
+## Meshing
+
+@pytest.mark.parametrize("size", [(1, 1, 1), (7, 5, 3), (12, 9, 10)])
+def test_mesh_grid_matches_legacy(size):
+    grid = random_grid(size, seed=sum(size))
+    expected = []
+    for color, (verts, faces) in legacy.VoxelObject(grid_voxels(grid).tolist(), size).generate_geometry().items():
+        expected += [(color, tuple(sorted(verts[i] for i in face))) for face in faces]
+
+    assert face_set(importer.mesh_grid(grid)) == sorted(expected)
+
+@pytest.mark.parametrize("seed", range(4))
+def test_merge_faces_covers_every_face_once(seed):
+    grid = random_grid((10, 8, 9), density=0.7, colors=2, seed=seed)
+    plain = importer.mesh_grid(grid)
+    greedy = importer.mesh_grid(grid, greedy=True)
+
+    assert len(greedy.faces) < len(plain.faces)
+    assert greedy.voxel_faces == plain.voxel_faces == len(plain.faces)
+    assert unit_faces(greedy) == unit_faces(plain)
+
+def test_weld_keeps_faces():
+    grid = random_grid((9, 9, 9), seed=1)
+    plain = importer.mesh_grid(grid)
+    welded = importer.mesh_grid(grid, weld=True)
+
+    assert len(welded.vertices) < len(plain.vertices)
+    assert len(np.unique(welded.vertices, axis=0)) == len(welded.vertices)
+    assert face_set(welded) == face_set(plain)
+
+@pytest.mark.parametrize("size, brick_size", [((13, 7, 20), 4), ((16, 16, 16), 8), ((5, 30, 9), 16), ((40, 40, 40), 4)])
+def test_mesh_bricks_matches_mesh_grid(size, brick_size):
+    # (40, 40, 40) in bricks of 4 has more bricks than fit in a uint8.
+    grid = random_grid(size, seed=brick_size)
+    voxels = grid_voxels(grid)
+
+    assert face_set(importer.mesh_bricks(voxels, size, brick_size)) == face_set(importer.mesh_grid(grid))
+    assert face_set(importer.mesh_bricks(voxels, size, brick_size, weld=True)) == face_set(importer.mesh_grid(grid))
+    assert unit_faces(importer.mesh_bricks(voxels, size, brick_size, greedy=True)) == unit_faces(importer.mesh_grid(grid))
+
+def test_mesh_bricks_empty():
+    mesh = importer.mesh_bricks(np.zeros((0, 4), dtype=np.uint8), (8, 8, 8), 4)
+    assert len(mesh.faces) == 0 and mesh.voxel_faces == 0
+
+@pytest.mark.parametrize("factor, slab", [(2, 16), (3, 2), (4, 1)])
+def test_downsample(factor, slab):
+    grid = random_grid((11, 9, 13), density=0.5, colors=3, seed=factor)
+    out = importer.downsample(grid, factor, slab)
+
+    size = -(-np.array(grid.shape) // factor)
+    assert out.shape == tuple(size)
+    for cell in itertools.product(*map(range, size)):
+        block = np.zeros((factor,) * 3, dtype=np.uint8)
+        part = grid[tuple(slice(c * factor, (c + 1) * factor) for c in cell)]
+        block[:part.shape[0], :part.shape[1], :part.shape[2]] = part
+
+        # Most common value, empty losing ties against colors and lower colors winning the rest.
+        values, counts = np.unique(block, return_counts=True)
+        best = max(zip(values.tolist(), counts.tolist()), key=lambda item: (item[1], item[0] != 0, -item[0]))[0]
+        assert out[cell] == best, cell
+
+
+################################################################################################################################################
+## Scene Graph
+
+def test_decode_rotation():
+    assert importer.decode_rotation(4) == importer.IDENTITY
+    assert importer.decode_rotation(0) == importer.IDENTITY # Invalid, both rows in column 0.
+
+    matrices = set()
+    for value in ROTATIONS:
+        matrix = np.array(importer.decode_rotation(value))
+        assert (np.abs(matrix).sum(axis=0) == 1).all() and (np.abs(matrix).sum(axis=1) == 1).all()
+        assert matrix[0, value & 3] == (-1 if value & 16 else 1)
+        assert matrix[1, value >> 2 & 3] == (-1 if value & 32 else 1)
+        matrices.add(importer.decode_rotation(value))
+    assert len(matrices) == 48 # Every signed permutation once.
+
+def test_compose():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        transforms = [(importer.decode_rotation(int(rng.choice(ROTATIONS))), tuple(rng.integers(-50, 50, 3).tolist())) for _ in range(3)]
+        (parent_rotation, parent_translation), (rotation, translation), _ = transforms
+
+        composed_rotation, composed_translation = importer.compose(transforms[0], transforms[1])
+        assert np.array_equal(composed_rotation, np.array(parent_rotation) @ np.array(rotation))
+        assert np.array_equal(composed_translation, np.array(parent_rotation) @ translation + parent_translation)
+
+        left = importer.compose(importer.compose(transforms[0], transforms[1]), transforms[2])
+        right = importer.compose(transforms[0], importer.compose(transforms[1], transforms[2]))
+        assert left == right
+
+    translation = ((1, 2, 3), (4, 5, 6))
+    assert importer.compose((importer.IDENTITY, translation[0]), (importer.IDENTITY, translation[1])) == (importer.IDENTITY, (5, 7, 9))
+
+def world_cell(model, rotation, translation, position):
+    # Lowest corner in world space of the voxel at position, from the corners of its unit box
+    # around the model origin.
+    rotation = np.array(rotation)
+    origin = np.array(model.size) // 2
+    corners = (np.array(position) - origin + np.array(list(itertools.product((0, 1), repeat=3)))) @ rotation.T + translation
+    return tuple(corners.min(axis=0).tolist())
+
+@pytest.mark.parametrize("seed", range(6))
+def test_scene_occlusion_matches_world_occupancy(seed):
+    rng = np.random.default_rng(seed)
+    grids = [random_grid(tuple(rng.integers(2, 7, 3).tolist()), 0.6, seed=seed * 10 + i) for i in range(3)]
+    models = [importer.VoxModel(grid.shape, grid_voxels(grid)) for grid in grids]
+
+    instances = [importer.SceneInstance(int(rng.integers(0, 3)), tuple(rng.integers(-4, 5, 3).tolist()), None,
+                                        rotation=importer.decode_rotation(int(rng.choice(ROTATIONS)))) for _ in range(5)]
+    occlusion = importer.SceneOcclusion(models, instances)
+
+    world = set()
+    for instance in instances:
+        model = models[instance.model_id]
+        world.update(world_cell(model, instance.rotation, instance.translation, voxel) for voxel in model.voxels[:, :3].tolist())
+
+    for model_id, model in enumerate(models):
+        users = [instance for instance in instances if instance.model_id == model_id]
+        hidden = occlusion.hidden(model_id)
+        for axis, sign, cells, _ in importer.exposed_faces(np.pad(model.grid, 1)):
+            expected = np.array([bool(users) and all(world_cell(model, instance.rotation, instance.translation,
+                                                                 cell + sign * np.eye(3, dtype=np.int64)[axis]) in world for instance in users)
+                                 for cell in cells], dtype=bool)
+            actual = hidden(axis, sign, cells) if hidden is not None else np.zeros(len(cells), dtype=bool)
+            assert np.array_equal(actual, expected), (model_id, axis, sign)
+
+
+################################################################################################################################################
+## Cache
+
+def write_test_scene(path):
+    models, nodes = synthetic.tiled_scene(2, 6)
+    synthetic.write_scene(path, models, synthetic.full_palette(), synthetic.mixed_materials(), nodes)
+
+def test_mesh_cache_round_trip(tmp_path):
+    path = str(tmp_path / "scene.vox")
+    write_test_scene(path)
+    cache = importer.MeshCache(str(tmp_path / "cache"), 2**30)
+    options = importer.MeshOptions(greedy=True, lods=(2,))
+
+    vox, meshes = importer.prepare_file(path, options, cache)
+    key = cache.key(path, options)
+    cached, cached_meshes = cache.load(key, vox.name)
+
+    assert np.array_equal(cached.palette, vox.palette)
+    assert cached.materials == vox.materials
+    assert [model.size for model in cached.models] == [model.size for model in vox.models]
+    assert all(np.array_equal(a.voxels, b.voxels) for a, b in zip(cached.models, vox.models))
+    assert [(i.model_id, i.translation, i.rotation) for i in cached.instances()] == [(i.model_id, i.translation, i.rotation) for i in vox.instances()]
+
+    assert len(cached_meshes) == len(meshes)
+    for a, b in zip(cached_meshes, meshes):
+        assert np.array_equal(a.vertices, b.vertices) and np.array_equal(a.faces, b.faces) and np.array_equal(a.colors, b.colors)
+        assert a.voxel_faces == b.voxel_faces
+
+@pytest.mark.parametrize("content", [b"", b"PK\x03\x04", None])
+def test_mesh_cache_bad_entry(tmp_path, content):
+    path = str(tmp_path / "scene.vox")
+    write_test_scene(path)
+    cache = importer.MeshCache(str(tmp_path / "cache"), 2**30)
+    options = importer.MeshOptions()
+    importer.prepare_file(path, options, cache)
+    entry = cache.path(cache.key(path, options))
+
+    if content is None: # Truncated.
+        with open(entry, 'rb') as file:
+            content = file.read()[:100]
+    with open(entry, 'wb') as file:
+        file.write(content)
+
+    assert cache.load(cache.key(path, options), "scene") is None
+    assert not os.path.exists(entry)
+    assert importer.prepare_file(path, options, cache)[0].models